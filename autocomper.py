@@ -1,5 +1,6 @@
 import configparser
 import os
+import queue
 import re
 import shutil
 import sys
@@ -9,19 +10,27 @@ import tkinter as tk
 import webbrowser
 from tkinter import filedialog, messagebox, ttk
 
+import onnxruntime as ort
 import sv_ttk
 from colorama import Fore, Style
 from kthread import KThread
 from PIL import Image, ImageTk
-from proglog import ProgressBarLogger
 
-from compile import compile_vid
+from compile import RENDER_BACKENDS
 from config import VERSION, REPO_URL
 from custom_tooltip import CustomHovertip
-from sound_reader import get_timestamps
+from ffmpeg_render import ENCODER_PROFILES, get_encode_speed
+from fingerprint import FINGERPRINT_STRATEGIES, configure_fingerprint
+from model_variants import (choose_variant, find_variants, get_chosen_variant,
+                            variant_base)
+from ort_tuning import AUTO_PROVIDER, configure_tuning
+from pipeline import (PipelineProgress, download_media, format_progress,
+                      run_pipeline)
+from sound_reader import clear_cached_timestamps
+from timestamp_cache import configure_cache
 from utils import (DOWNLOAD_QUALITY_OPTIONS, FFMPEG_PATH, MediaUpload,
-                   download_audio, download_video, get_bundle_filepath,
-                   get_number_of_vids_in_playlist, is_valid_yt_dlp_url)
+                   get_bundle_filepath, get_number_of_vids_in_playlist,
+                   is_valid_yt_dlp_url, list_models)
 
 VIDEO_INPUT = [("Video Files",  "*.mp4 *.avi *.mkv *.m4v *.mov")]
 VIDEO_OUTPUT = [("Video Files", "*.mp4"), ("All Files", "*.*")]
@@ -33,7 +42,22 @@ DEFAULT_SETTINGS = {
     'download_path': "No location selected!",
     'max_quality': "No Limit",
     'max_download_speed': '0',
-    'output_text_path': "No file selected!"
+    'output_text_path': "No file selected!",
+    'memory_budget_mb': '256',
+    'batch_size': '1',
+    'detection_workers': '1',
+    'pack_short_files': False,
+    'cache_path': '',
+    'cache_max_mb': '256',
+    'fingerprint_strategy': 'sampled',
+    'render_backend': 'ffmpeg',
+    'fast_cut': False,
+    'render_workers': '1',
+    'encoder_profile': 'balanced',
+    'console_max_lines': '5000',
+    'download_workers': '3',
+    'inference_provider': 'Auto',
+    'inference_threads': '0'
 }
 
 os.environ['FFMPEG_BINARY'] = FFMPEG_PATH
@@ -55,6 +79,11 @@ def clean_filename(filename: str, replacement: str = "_") -> str:
 
 TEMP_DIR = tempfile.TemporaryDirectory().name
 
+UI_POLL_INTERVAL_MS = 50
+CONSOLE_FLUSH_INTERVAL_MS = 100
+# Used when the screen is tall enough to show every setting without scrolling
+SETTINGS_MODAL_HEIGHT = 1140
+
 
 class VideoProcessorApp:
     def __init__(self, root):
@@ -118,6 +147,21 @@ class VideoProcessorApp:
         self.max_download_speed = tk.IntVar()
         
         self.output_text_path = tk.StringVar()
+        self.memory_budget_mb = tk.IntVar()
+        self.batch_size = tk.IntVar()
+        self.detection_workers = tk.IntVar()
+        self.pack_short_files = tk.BooleanVar()
+        self.cache_path = tk.StringVar()
+        self.cache_max_mb = tk.IntVar()
+        self.fingerprint_strategy = tk.StringVar()
+        self.render_backend = tk.StringVar()
+        self.fast_cut = tk.BooleanVar()
+        self.render_workers = tk.IntVar()
+        self.encoder_profile = tk.StringVar()
+        self.console_max_lines = tk.IntVar()
+        self.download_workers = tk.IntVar()
+        self.inference_provider = tk.StringVar()
+        self.inference_threads = tk.IntVar()
 
         self.keep_downloaded_vids.set(bool(
             self.preferences.get("Settings", "keep_downloaded_vids")))
@@ -134,6 +178,52 @@ class VideoProcessorApp:
         self.output_text_path.set(
             self.preferences.get("Settings", "output_text_path"))
 
+        self.memory_budget_mb.set(int(
+            self.preferences.get("Settings", "memory_budget_mb")))
+
+        self.batch_size.set(int(
+            self.preferences.get("Settings", "batch_size")))
+
+        self.detection_workers.set(int(
+            self.preferences.get("Settings", "detection_workers")))
+        self.pack_short_files.set(
+            self.preferences.getboolean("Settings", "pack_short_files"))
+
+        self.cache_path.set(
+            self.preferences.get("Settings", "cache_path"))
+
+        self.cache_max_mb.set(int(
+            self.preferences.get("Settings", "cache_max_mb")))
+
+        self.fingerprint_strategy.set(
+            self.preferences.get("Settings", "fingerprint_strategy"))
+
+        self.render_backend.set(
+            self.preferences.get("Settings", "render_backend"))
+
+        self.fast_cut.set(
+            self.preferences.getboolean("Settings", "fast_cut"))
+
+        self.render_workers.set(int(
+            self.preferences.get("Settings", "render_workers")))
+
+        self.encoder_profile.set(
+            self.preferences.get("Settings", "encoder_profile"))
+
+        self.console_max_lines.set(int(
+            self.preferences.get("Settings", "console_max_lines")))
+
+        self.download_workers.set(int(
+            self.preferences.get("Settings", "download_workers")))
+
+        self.inference_provider.set(
+            self.preferences.get("Settings", "inference_provider"))
+
+        self.inference_threads.set(int(
+            self.preferences.get("Settings", "inference_threads")))
+
+        self.apply_cache_settings()
+
         # Create a list to store uploaded video file paths
         self.uploaded_videos = []
 
@@ -255,13 +345,7 @@ class VideoProcessorApp:
 
         # Model Dropdown
         # First, get list of available models
-        models = os.listdir(self.models_dir)
-
-        # Filter out directories, keep only onnx files
-        models = [item for item in models if os.path.isfile(
-            os.path.join(self.models_dir, item))]
-
-        models = [item for item in models if item.endswith('.onnx')]
+        models = sorted(list_models(self.models_dir))
 
         if len(models) == 0:
             raise Exception(f"No models found in directory {self.models_dir}")
@@ -274,6 +358,17 @@ class VideoProcessorApp:
 
         self.model_dropdown.current(0)  # default dropdown option
 
+        # Default to the fastest variant of the model for this computer,
+        # benchmarking them in the background the first time
+        self.variant_thread = None
+        chosen_model = get_chosen_variant(self.model.get())
+        if chosen_model in models:
+            self.model.set(chosen_model)
+        elif len(find_variants(self.models_dir, variant_base(self.model.get()))) > 1:
+            self.variant_thread = threading.Thread(target=self.choose_model_variant,
+                                                   args=(self.model.get(),), daemon=True)
+            self.variant_thread.start()
+
         self.model_dropdown.pack()
 
         # Precision Entry
@@ -434,7 +529,14 @@ class VideoProcessorApp:
         self.ui_bar = ttk.Progressbar(right_frame, orient='horizontal')
         self.ui_bar.pack(fill=tk.X, padx=10, pady=10)
 
-        self.final_bar = FinalRenderBar(ui=self.ui_bar)
+        # Stage, throughput and time left for the current job
+        self.progress_label = ttk.Label(right_frame, text="")
+        self.progress_label.pack(fill=tk.X, padx=10)
+
+        # Worker threads never touch widgets; they post to this queue and
+        # the Tk thread runs what they posted from poll_ui_queue
+        self.ui_queue = queue.Queue()
+        self.progress = PipelineProgress(self.post_event)
 
         self.stdout_frame = ttk.Frame(right_frame, width=200, height=100)
 
@@ -456,7 +558,12 @@ class VideoProcessorApp:
         self.stdout_frame.pack(fill=tk.BOTH, expand=True)
 
         # Redirect stdout to the Text widget
-        sys.stdout = StdoutRedirector(self.stdout_text)  # TODO: Change this
+        self.console = StdoutRedirector(
+            self.stdout_text, self.console_max_lines.get())
+        sys.stdout = self.console
+        self.root.after(CONSOLE_FLUSH_INTERVAL_MS, self.flush_console)
+
+        self.root.after(UI_POLL_INTERVAL_MS, self.poll_ui_queue)
 
         self.active_thread = None
 
@@ -850,8 +957,19 @@ class VideoProcessorApp:
                     self.output_location_label, f"{self.output_video_path.get()}")
 
     def process_videos_multi(self):
+        try:
+            job = self.prepare_job()
+        except Exception as e:
+            messagebox.showerror("Error", e)
+            print(f"\n{Fore.RED}FAILURE: " + str(e))
+            return
+
+        self.disable_objects()
+
+        self.console.clear()
+
         # Run video processing in new thread so the app doesn't hang
-        self.active_thread = KThread(target=self.process_videos)
+        self.active_thread = KThread(target=self.process_videos, args=(job,))
         self.active_thread.start()
 
     def is_thread_active(self):
@@ -893,10 +1011,50 @@ class VideoProcessorApp:
             "Settings", "max_download_speed", str(self.max_download_speed.get()))
         self.preferences.set(
             "Settings", "output_text_path", self.output_text_path.get())
+        self.preferences.set(
+            "Settings", "memory_budget_mb", str(self.memory_budget_mb.get()))
+        self.preferences.set(
+            "Settings", "batch_size", str(self.batch_size.get()))
+        self.preferences.set(
+            "Settings", "detection_workers", str(self.detection_workers.get()))
+        self.preferences.set(
+            "Settings", "pack_short_files", str(self.pack_short_files.get()))
+        self.preferences.set(
+            "Settings", "cache_path", str(self.cache_path.get()))
+        self.preferences.set(
+            "Settings", "cache_max_mb", str(self.cache_max_mb.get()))
+        self.preferences.set(
+            "Settings", "fingerprint_strategy", str(self.fingerprint_strategy.get()))
+        self.preferences.set(
+            "Settings", "render_backend", str(self.render_backend.get()))
+        self.preferences.set(
+            "Settings", "fast_cut", str(self.fast_cut.get()))
+        self.preferences.set(
+            "Settings", "render_workers", str(self.render_workers.get()))
+        self.preferences.set(
+            "Settings", "encoder_profile", str(self.encoder_profile.get()))
+        self.preferences.set(
+            "Settings", "console_max_lines", str(self.console_max_lines.get()))
+        self.preferences.set(
+            "Settings", "download_workers", str(self.download_workers.get()))
+        self.preferences.set(
+            "Settings", "inference_provider", str(self.inference_provider.get()))
+        self.preferences.set(
+            "Settings", "inference_threads", str(self.inference_threads.get()))
 
         with open(self.preferences_file, 'w') as configfile:
             self.preferences.write(configfile)
 
+        self.apply_cache_settings()
+        self.console.max_lines = self.console_max_lines.get()
+
+    def apply_cache_settings(self):
+        configure_cache(self.cache_path.get().strip() or None,
+                        self.cache_max_mb.get())
+        configure_fingerprint(self.fingerprint_strategy.get())
+        configure_tuning(provider=self.inference_provider.get(),
+                         threads=self.inference_threads.get())
+
     def reset_preferences_to_file(self):
         self.keep_downloaded_vids.set(self.preferences.get(
             "Settings", "keep_downloaded_vids"))
@@ -912,19 +1070,64 @@ class VideoProcessorApp:
         self.output_text_path.set(self.preferences.get(
             "Settings", "output_text_path"
         ))
+        self.memory_budget_mb.set(self.preferences.get(
+            "Settings", "memory_budget_mb"
+        ))
+        self.batch_size.set(self.preferences.get(
+            "Settings", "batch_size"
+        ))
+        self.detection_workers.set(self.preferences.get(
+            "Settings", "detection_workers"
+        ))
+        self.pack_short_files.set(self.preferences.getboolean(
+            "Settings", "pack_short_files"))
+        self.cache_path.set(self.preferences.get(
+            "Settings", "cache_path"
+        ))
+        self.cache_max_mb.set(self.preferences.get(
+            "Settings", "cache_max_mb"
+        ))
+        self.fingerprint_strategy.set(self.preferences.get(
+            "Settings", "fingerprint_strategy"
+        ))
+        self.render_backend.set(self.preferences.get(
+            "Settings", "render_backend"
+        ))
+        self.fast_cut.set(self.preferences.getboolean(
+            "Settings", "fast_cut"))
+        self.render_workers.set(self.preferences.get(
+            "Settings", "render_workers"
+        ))
+        self.encoder_profile.set(self.preferences.get(
+            "Settings", "encoder_profile"
+        ))
+        self.console_max_lines.set(self.preferences.get(
+            "Settings", "console_max_lines"
+        ))
+        self.download_workers.set(self.preferences.get(
+            "Settings", "download_workers"
+        ))
+        self.inference_provider.set(self.preferences.get(
+            "Settings", "inference_provider"
+        ))
+        self.inference_threads.set(self.preferences.get(
+            "Settings", "inference_threads"
+        ))
 
     def open_settings_modal(self):
         self.root.grab_set()
         modal = tk.Toplevel(self.root)
         modal.title("Settings")
-        modal.geometry("640x480")
-        modal.resizable(False, False)
+        modal.resizable(True, True)
+        modal.minsize(480, 300)
 
         x = self.root.winfo_x() + 15
         y = self.root.winfo_y() + 15
+        # Leave room for the taskbar and title bar on small screens; the settings scroll instead
+        height = min(SETTINGS_MODAL_HEIGHT, modal.winfo_screenheight() - y - 80)
 
         # Set the modal's position relative to the parent window
-        modal.geometry(f"640x480+{x}+{y}")
+        modal.geometry(f"640x{height}+{x}+{y}")
 
         def on_close_save(event=None):
             self.save_settings()
@@ -944,9 +1147,41 @@ class VideoProcessorApp:
         # in preferences.ini to maintain consistency
         self.reset_preferences_to_file()
 
+        # The Save button stays at the bottom while the settings above it scroll
+        footer = ttk.Frame(modal)
+        footer.pack(side=tk.BOTTOM, fill=tk.X)
+
+        scroll_frame = ttk.Frame(modal)
+        scroll_frame.pack(fill=tk.BOTH, expand=True)
+        canvas = tk.Canvas(scroll_frame, highlightthickness=0,
+                           background=ttk.Style().lookup("TFrame", "background"))
+        settings_scrollbar = ttk.Scrollbar(
+            scroll_frame, orient="vertical", command=canvas.yview)
+        canvas.configure(yscrollcommand=settings_scrollbar.set)
+        settings_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        content = ttk.Frame(canvas)
+        content_window = canvas.create_window((0, 0), window=content, anchor=tk.NW)
+        content.bind("<Configure>", lambda event: canvas.configure(
+            scrollregion=canvas.bbox("all")))
+        canvas.bind("<Configure>", lambda event: canvas.itemconfigure(
+            content_window, width=event.width))
+
+        def scroll_settings(event):
+            if event.num == 4 or event.delta > 0:
+                canvas.yview_scroll(-1, "units")
+            elif event.num == 5 or event.delta < 0:
+                canvas.yview_scroll(1, "units")
+
+        # Wheel events reach the modal's bindings from any widget inside it
+        modal.bind("<MouseWheel>", scroll_settings)
+        modal.bind("<Button-4>", scroll_settings)
+        modal.bind("<Button-5>", scroll_settings)
+
         # DOWNLOAD SETTINGS
 
-        ttk.Label(modal, text="Download Settings",
+        ttk.Label(content, text="Download Settings",
                   font=(None, 14, "bold")).pack(pady=(20, 5))
 
         def toggle_download_button():
@@ -960,11 +1195,11 @@ class VideoProcessorApp:
                 self.clear_download_location_button.config(state="disabled")
 
         self.keep_saved_vids_checkbox = ttk.Checkbutton(
-            modal, text="Keep Media Downloaded By URL", variable=self.keep_downloaded_vids,
+            content, text="Keep Media Downloaded By URL", variable=self.keep_downloaded_vids,
             command=toggle_download_button)
         self.keep_saved_vids_checkbox.pack()
 
-        download_settings_frame = ttk.Frame(modal)
+        download_settings_frame = ttk.Frame(content)
 
         def get_download_location():
             folder_path = filedialog.askdirectory()
@@ -1027,19 +1262,161 @@ class VideoProcessorApp:
 
         max_download_speed_frame.pack()
 
+        download_workers_frame = ttk.Frame(download_settings_frame)
+
+        self.download_workers_label = ttk.Label(
+            download_workers_frame, text="Parallel Downloads:", font=(None, 11, "bold"))
+
+        self.download_workers_entry = ttk.Entry(
+            download_workers_frame, textvariable=self.download_workers, validate='key', validatecommand=self.num_check)
+
+        self.download_workers_label.pack(side="left", padx=5, pady=5)
+        self.download_workers_entry.pack(side="left", padx=5, pady=5)
+
+        download_workers_frame.pack()
+
         download_settings_frame.pack()
 
         toggle_download_button()
 
-        ttk.Separator(modal, orient="horizontal").pack(
+        ttk.Separator(content, orient="horizontal").pack(
+            fill=tk.X, pady=5)
+
+        # DETECTION SETTINGS
+
+        ttk.Label(content, text="Detection Settings",
+                  font=(None, 14, "bold")).pack(pady=(20, 5))
+
+        detection_settings_frame = ttk.Frame(content)
+
+        memory_budget_frame = ttk.Frame(detection_settings_frame)
+
+        self.memory_budget_label = ttk.Label(
+            memory_budget_frame, text="Decode Memory Budget (MB):", font=(None, 11, "bold"))
+
+        self.memory_budget_entry = ttk.Entry(
+            memory_budget_frame, textvariable=self.memory_budget_mb, validate='key', validatecommand=self.num_check)
+
+        self.memory_budget_label.pack(side="left", padx=5, pady=5)
+        self.memory_budget_entry.pack(side="left", padx=5, pady=5)
+
+        memory_budget_frame.pack()
+
+        batch_size_frame = ttk.Frame(detection_settings_frame)
+
+        self.batch_size_label = ttk.Label(
+            batch_size_frame, text="Inference Batch Size:", font=(None, 11, "bold"))
+
+        self.batch_size_entry = ttk.Entry(
+            batch_size_frame, textvariable=self.batch_size, validate='key', validatecommand=self.num_check)
+
+        self.batch_size_label.pack(side="left", padx=5, pady=5)
+        self.batch_size_entry.pack(side="left", padx=5, pady=5)
+
+        batch_size_frame.pack()
+
+        detection_workers_frame = ttk.Frame(detection_settings_frame)
+
+        self.detection_workers_label = ttk.Label(
+            detection_workers_frame, text="Parallel Detection Jobs:", font=(None, 11, "bold"))
+
+        self.detection_workers_entry = ttk.Entry(
+            detection_workers_frame, textvariable=self.detection_workers, validate='key', validatecommand=self.num_check)
+
+        self.detection_workers_label.pack(side="left", padx=5, pady=5)
+        self.detection_workers_entry.pack(side="left", padx=5, pady=5)
+
+        detection_workers_frame.pack()
+
+        self.pack_short_files_checkbox = ttk.Checkbutton(
+            detection_settings_frame, text="Pack Short Files Together", variable=self.pack_short_files)
+        self.pack_short_files_checkbox.pack()
+
+        cache_path_frame = ttk.Frame(detection_settings_frame)
+
+        self.cache_path_label = ttk.Label(
+            cache_path_frame, text="Timestamp Cache File:", font=(None, 11, "bold"))
+
+        self.cache_path_entry = ttk.Entry(
+            cache_path_frame, textvariable=self.cache_path)
+
+        self.cache_path_label.pack(side="left", padx=5, pady=5)
+        self.cache_path_entry.pack(side="left", padx=5, pady=5)
+
+        cache_path_frame.pack()
+
+        cache_max_mb_frame = ttk.Frame(detection_settings_frame)
+
+        self.cache_max_mb_label = ttk.Label(
+            cache_max_mb_frame, text="Max Cache Size (MB):", font=(None, 11, "bold"))
+
+        self.cache_max_mb_entry = ttk.Entry(
+            cache_max_mb_frame, textvariable=self.cache_max_mb, validate='key', validatecommand=self.num_check)
+
+        self.cache_max_mb_label.pack(side="left", padx=5, pady=5)
+        self.cache_max_mb_entry.pack(side="left", padx=5, pady=5)
+
+        cache_max_mb_frame.pack()
+
+        fingerprint_strategy_frame = ttk.Frame(detection_settings_frame)
+
+        self.fingerprint_strategy_label = ttk.Label(
+            fingerprint_strategy_frame, text="File Fingerprint:", font=(None, 11, "bold"))
+
+        self.fingerprint_strategy_entry = ttk.Combobox(
+            fingerprint_strategy_frame, textvariable=self.fingerprint_strategy, values=FINGERPRINT_STRATEGIES, state="readonly")
+
+        self.fingerprint_strategy_label.pack(side="left", padx=5, pady=5)
+        self.fingerprint_strategy_entry.pack(side="left", padx=5, pady=5)
+
+        fingerprint_strategy_frame.pack()
+
+        inference_provider_frame = ttk.Frame(detection_settings_frame)
+
+        self.inference_provider_label = ttk.Label(
+            inference_provider_frame, text="Inference Provider:", font=(None, 11, "bold"))
+
+        self.inference_provider_entry = ttk.Combobox(
+            inference_provider_frame, textvariable=self.inference_provider, values=[AUTO_PROVIDER] + ort.get_available_providers(), state="readonly")
+
+        self.inference_provider_label.pack(side="left", padx=5, pady=5)
+        self.inference_provider_entry.pack(side="left", padx=5, pady=5)
+
+        inference_provider_frame.pack()
+
+        inference_threads_frame = ttk.Frame(detection_settings_frame)
+
+        self.inference_threads_label = ttk.Label(
+            inference_threads_frame, text="Inference Threads:", font=(None, 11, "bold"))
+
+        self.inference_threads_entry = ttk.Entry(
+            inference_threads_frame, textvariable=self.inference_threads, validate='key', validatecommand=self.num_check)
+
+        self.inference_threads_label.pack(side="left", padx=5, pady=5)
+        self.inference_threads_entry.pack(side="left", padx=5, pady=5)
+
+        inference_threads_frame.pack()
+
+        def clear_timestamp_cache():
+            if messagebox.askyesno("Clear Timestamp Cache",
+                                   "All stored timestamps will be removed and media will be analyzed again on the next run. Continue?", parent=modal):
+                clear_cached_timestamps()
+
+        self.clear_cache_button = ttk.Button(
+            detection_settings_frame, text="Clear Timestamp Cache", command=clear_timestamp_cache)
+        self.clear_cache_button.pack(pady=5)
+
+        detection_settings_frame.pack()
+
+        ttk.Separator(content, orient="horizontal").pack(
             fill=tk.X, pady=5)
 
         # OUTPUT SETTINGS
 
-        ttk.Label(modal, text="Output Settings",
+        ttk.Label(content, text="Output Settings",
                   font=(None, 14, "bold")).pack(pady=(20, 5))
 
-        output_settings_frame = ttk.Frame(modal)
+        output_settings_frame = ttk.Frame(content)
 
         def get_text_output_location():
             file_name = filedialog.asksaveasfilename(
@@ -1071,18 +1448,74 @@ class VideoProcessorApp:
 
         text_output_frame.pack()
 
+        render_backend_frame = ttk.Frame(output_settings_frame)
+
+        self.render_backend_label = ttk.Label(
+            render_backend_frame, text="Render Backend:", font=(None, 11, "bold"))
+
+        self.render_backend_entry = ttk.Combobox(
+            render_backend_frame, textvariable=self.render_backend, values=RENDER_BACKENDS, state="readonly")
+
+        self.render_backend_label.pack(side="left", padx=5, pady=5)
+        self.render_backend_entry.pack(side="left", padx=5, pady=5)
+
+        render_backend_frame.pack()
+
+        self.fast_cut_checkbox = ttk.Checkbutton(
+            output_settings_frame, text="Fast Cut (Copy Keyframe-Aligned Video)", variable=self.fast_cut)
+        self.fast_cut_checkbox.pack()
+
+        render_workers_frame = ttk.Frame(output_settings_frame)
+
+        self.render_workers_label = ttk.Label(
+            render_workers_frame, text="Render Workers:", font=(None, 11, "bold"))
+
+        self.render_workers_entry = ttk.Entry(
+            render_workers_frame, textvariable=self.render_workers, validate='key', validatecommand=self.num_check)
+
+        self.render_workers_label.pack(side="left", padx=5, pady=5)
+        self.render_workers_entry.pack(side="left", padx=5, pady=5)
+
+        render_workers_frame.pack()
+
+        encoder_profile_frame = ttk.Frame(output_settings_frame)
+
+        self.encoder_profile_label = ttk.Label(
+            encoder_profile_frame, text="Encoder Profile:", font=(None, 11, "bold"))
+
+        self.encoder_profile_entry = ttk.Combobox(
+            encoder_profile_frame, textvariable=self.encoder_profile, values=list(ENCODER_PROFILES), state="readonly")
+
+        self.encoder_profile_label.pack(side="left", padx=5, pady=5)
+        self.encoder_profile_entry.pack(side="left", padx=5, pady=5)
+
+        encoder_profile_frame.pack()
+
+        console_max_lines_frame = ttk.Frame(output_settings_frame)
+
+        self.console_max_lines_label = ttk.Label(
+            console_max_lines_frame, text="Console Lines:", font=(None, 11, "bold"))
+
+        self.console_max_lines_entry = ttk.Entry(
+            console_max_lines_frame, textvariable=self.console_max_lines, validate='key', validatecommand=self.num_check)
+
+        self.console_max_lines_label.pack(side="left", padx=5, pady=5)
+        self.console_max_lines_entry.pack(side="left", padx=5, pady=5)
+
+        console_max_lines_frame.pack()
+
         output_settings_frame.pack()
 
-        ttk.Separator(modal, orient="horizontal").pack(
+        ttk.Separator(footer, orient="horizontal").pack(
             fill=tk.X, pady=5)
 
         style = ttk.Style()
         style.configure("Custom.TButton", font=("Helvetica", 14))
-        ttk.Button(modal, text="Save Settings", command=on_close_save,
+        ttk.Button(footer, text="Save Settings", command=on_close_save,
                    style="Custom.TButton").pack(pady=20)
 
         self.version_label = ttk.Label(
-            modal, text=f"Autocomper v{VERSION}", font=(None, 10, "normal"), cursor="hand2")
+            footer, text=f"Autocomper v{VERSION}", font=(None, 10, "normal"), cursor="hand2")
 
         self.version_label.pack(side="bottom", padx=5, pady=(5, 15))
         
@@ -1102,6 +1535,58 @@ class VideoProcessorApp:
         max_speed_tooltip = CustomHovertip(
             self.max_download_speed_entry, 'Max allowable download speed in kilobytes per second. 0 means no limit.')
 
+        memory_budget_tooltip = CustomHovertip(
+            self.memory_budget_entry, 'Approximate memory (in MB) used to buffer decoded audio while detecting.\nAt least two blocks are always buffered, so very large block sizes can exceed this.')
+
+        batch_size_tooltip = CustomHovertip(
+            self.batch_size_entry, 'Number of audio blocks sent to the model at once.\nHigher values can use many-core CPUs better, especially with small block sizes,\nbut multiply the memory used for inference.')
+
+        detection_workers_tooltip = CustomHovertip(
+            self.detection_workers_entry, 'Number of input files to run detection on at the same time.\nCPU threads are split between jobs, so this mostly helps on machines with many cores.')
+
+        pack_short_files_tooltip = CustomHovertip(
+            self.pack_short_files_checkbox, 'Runs the model once for several short files joined together, with a\nsecond of silence between them. Much faster for batches of short clips.')
+
+        cache_path_tooltip = CustomHovertip(
+            self.cache_path_entry, 'SQLite file used to remember timestamps between runs.\nLeave empty to use the default location in your home folder.')
+
+        cache_max_mb_tooltip = CustomHovertip(
+            self.cache_max_mb_entry, 'Once the timestamp cache grows past this size, the least recently used entries are removed.')
+
+        fingerprint_strategy_tooltip = CustomHovertip(
+            self.fingerprint_strategy_entry, 'How input files are identified in the timestamp cache.\nsampled: size plus a few chunks of the file (fastest)\nfull: fast hash of the whole file\nsha256: cryptographic hash of the whole file (slowest)')
+
+        render_backend_tooltip = CustomHovertip(
+            self.render_backend_entry, 'ffmpeg: cut and join clips natively with ffmpeg (fast)\nmoviepy: the original renderer (slow, kept as a fallback)')
+
+        fast_cut_tooltip = CustomHovertip(
+            self.fast_cut_checkbox, 'Copies the parts of each clip between keyframes instead of re-encoding them.\nOnly used with the ffmpeg backend, for H.264/AAC media without a custom resolution or normalization.')
+
+        render_workers_tooltip = CustomHovertip(
+            self.render_workers_entry, 'Number of input files to write at the same time with the ffmpeg backend,\nwhen they are not combined. Encoder threads are split between jobs to avoid overloading the CPU.')
+
+        encoder_profile_lines = ['Quality and speed of the encoder for written media.']
+        for name, profile in ENCODER_PROFILES.items():
+            speed = get_encode_speed(name)
+            line = f"{name}: x264 {profile['preset']} preset, CRF {profile['crf']}, {profile['audio_bitrate'] or 'default'} audio"
+            if speed:
+                line += f" (about {speed:.1f}x realtime here)"
+            encoder_profile_lines.append(line)
+        encoder_profile_tooltip = CustomHovertip(
+            self.encoder_profile_entry, '\n'.join(encoder_profile_lines))
+
+        console_max_lines_tooltip = CustomHovertip(
+            self.console_max_lines_entry, 'Lines of output kept in the console. Older lines are dropped\nonce there are more than this, which keeps long batches from slowing the app down.')
+
+        download_workers_tooltip = CustomHovertip(
+            self.download_workers_entry, 'Number of URLs to download at the same time. Sites often throttle each\nconnection, so a few at once finishes sooner. The max download speed is split between them.')
+
+        inference_provider_tooltip = CustomHovertip(
+            self.inference_provider_entry, 'Where the model runs. Auto uses the fastest option measured on this computer\nthe first time a model is used. Pick one to override it.')
+
+        inference_threads_tooltip = CustomHovertip(
+            self.inference_threads_entry, 'CPU threads per detection job. 0 uses the number measured as fastest on this computer.')
+
         folder_tooltip_two = CustomHovertip(
             self.text_location_button, 'Choose Timestamp TXT Output Location')
         clear_tooltip_two = CustomHovertip(
@@ -1115,244 +1600,48 @@ class VideoProcessorApp:
         modal.focus_set()
         self.root.wait_window(modal)
 
-    def handle_url_downloads(self):
-        keep_downloaded_vids = self.keep_downloaded_vids.get()
-        download_path = self.download_video_path.get()
-        if not keep_downloaded_vids:
-            download_path = TEMP_DIR
+    def handle_url_downloads(self, job):
+        # Runs on the worker thread; anything that needs Tk is posted to the UI queue
+        urls = [video for video in self.uploaded_videos if video.get_is_url()]
+        results = download_media(
+            [(video.get_type(), video.get_url(), video.get_path()) for video in urls],
+            job['download_path'], job['max_quality'], job['max_download_speed'],
+            job['download_workers'], self.progress)
+
+        # Keep what was downloaded even if something failed, so processing
+        # again picks up where it left off
+        failures = []
+        for video, (success, result) in zip(urls, results):
+            if not success:
+                failures.append(f"{video.get_path()}: {result}")
+            elif result:
+                video.set_path(result)
+                video.set_is_url(False)
+            else:
+                self.uploaded_videos.remove(video)
+        self.post(self.update_listbox)
 
-        if keep_downloaded_vids and (not download_path or download_path == "No location selected!"):
+        if failures:
             raise Exception(
-                "Please set a directory to save downloaded media. You can do this by clicking the gear in the top left.")
-
-        indices_to_delete = []
-        for i, video in enumerate(self.uploaded_videos):
-            media_type = video.get_type()
-            media_path = video.get_path()
-            media_url = video.get_url()
-
-            print(
-                f"{Fore.GREEN}[{i + 1}/{len(self.uploaded_videos)}]{Style.RESET_ALL} Downloading {media_path}")
-
-            if not video.get_is_url():
-                print(f"{Fore.YELLOW}Not a URL, skipping...")
-                continue
-
-            output_path = os.path.join(
-                download_path,
-                str(media_path) +
-                (".mp4" if media_type == "video" else ".mp3")
-            )
-            if os.path.exists(output_path):
-                if messagebox.askyesno(
-                    title="Media Already Exists",
-                    message=f"The media '{media_path}' already exists in the download directory. Would you like to use the existing file? If not, the media will be redownloaded and overwrite the existing file."""
-                ):
-                    self.uploaded_videos[i].set_path(output_path)
-                    self.uploaded_videos[i].set_is_url(False)
-                    print(f"{Fore.GREEN}Done!")
-                    continue
-
-            if media_type == 'video':
-                success, result = download_video(
-                    media_url, media_path, download_path, self.max_quality.get(), self.max_download_speed.get(), self.final_bar)
-                if success:
-                    if result:
-                        self.uploaded_videos[i].set_path(result)
-                        self.uploaded_videos[i].set_is_url(False)
-                    else:
-                        indices_to_delete.append(i)
-                        print(f"{Fore.YELLOW}No video found, skipping")
-                else:
-                    raise Exception(
-                        f"Failed to download {media_path}: {result}\nPress 'Process' again and it should start from where you left off.")
-            elif media_type == 'audio':
-                success, result = download_audio(
-                    media_url, media_path, download_path, self.max_download_speed.get(), self.final_bar)
-                if success:
-                    self.uploaded_videos[i].set_path(result)
-                    self.uploaded_videos[i].set_is_url(False)
-                else:
-                    raise Exception(
-                        f"Failed to download {media_path}: {result}\nPress 'Process' again and it should start from where you left off.")
-
-            print(f"{Fore.GREEN}Done!")
-
-        for idx in reversed(indices_to_delete):
-            del self.uploaded_videos[idx]
-        self.update_listbox()
-
-    def process_videos(self):
-        self.disable_objects()
-        self.final_bar.reset_total_progress(1)
-
-        self.reset_preferences_to_file()
+                "Failed to download " + "\n".join(failures) + "\nPress 'Process' again and it should start from where you left off.")
 
+    def process_videos(self, job):
+        # Worker thread: only plain values from the job, and no Tk calls
         try:
-            precision = self.precision.get()
-            block_size = self.block_size.get()
-            threshold = self.threshold.get()
-            selected_model = os.path.join(self.models_dir, self.model.get())
-            merge_clips = self.merge_clips.get()
-            combine = self.combine_vids.get()
-            normalize = self.normalize_audio.get()
-            save_timestamps = self.save_txt.get()
-
-            # Get model location if in a compiled app
-            selected_model = get_bundle_filepath(selected_model)
-
-            self.stdout_text["state"] = tk.NORMAL
-            self.stdout_text.delete("1.0", tk.END)
-            self.stdout_text["state"] = tk.DISABLED
-            self.root.update_idletasks()
-
-            if not self.uploaded_videos:
-                raise Exception("Please pick some videos to compile.")
-
-            if not self.output_video_path.get() or self.output_video_path.get() == "No location selected!":
-                raise Exception("Please specify an output location.")
-
-            output_video_path = self.output_video_path.get()
-
-            dict_list = []
-
-            if combine and os.path.exists(output_video_path):
-                if not messagebox.askyesno("Confirm Overwrite",
-                                           f"Output file \'{output_video_path}\' already exists and will be overwritten. Would you like to continue?"):
-                    raise (Exception("Operation cancelled."))
-
-            if not combine:
-                for video in self.uploaded_videos:
-                    video = video.get_path()
-                    print(video)
-                    temp = str(video.split('/')[-1]).rsplit('.', 1)
-                    temp = '.'.join(temp[:-1])
-                    temp = str(output_video_path + '/' + temp + "_comped.mp4")
-                    if os.path.exists(temp):
-                        if not messagebox.askyesno("Confirm Overwrite",
-                                                   f"Output file \'{video}\' already exists and will be overwritten. Would you like to continue?"):
-                            raise (Exception("Operation cancelled."))
-
             if any(x.get_is_url() for x in self.uploaded_videos):
-                self.handle_url_downloads()
+                self.handle_url_downloads(job)
 
-            res = ()
-            if self.use_custom_resolution.get():
-                res = (
-                    self.custom_resolution_width_var.get(),
-                    self.custom_resolution_height_var.get()
-                )
-            else:
-                res = None
+            output_video_path = job['output']
+            input_paths = [x.get_path() for x in self.uploaded_videos]
 
-            padding = ()
-            if self.use_custom_padding.get():
-                padding = (
-                    self.custom_padding_before.get(),
-                    self.custom_padding_after.get()
-                )
-            else:
-                padding = None
+            # Timing the model variants while detection runs would skew both
+            if self.variant_thread is not None and self.variant_thread.is_alive():
+                print("Waiting for the model benchmark to finish...")
+                self.variant_thread.join()
 
             try:
-                vids_with_clips = 0
-                self.final_bar.reset_total_progress(
-                    (len(self.uploaded_videos) * 100 * 2))
-
-                for i, input_video_path in enumerate(self.uploaded_videos):
-                    input_video_path = input_video_path.get_path()
-                    print(
-                        f"{Fore.GREEN}[{i + 1}/{len(self.uploaded_videos)}]{Style.RESET_ALL} Getting timestamps for {os.path.basename(input_video_path)}")
-                    timestamps, used_existing_data = get_timestamps(
-                        input_video_path, precision, block_size, threshold, 58, selected_model, self.final_bar)
-                    dict_list.append(timestamps)
-                    if used_existing_data: print(f"{Fore.GREEN}Using existing timestamp data from previous run.")
-                    num_found = len(timestamps['timestamps'])
-                    if num_found > 1:
-                        print(
-                            f"{Fore.GREEN}Found {len(timestamps['timestamps'])} clips.")
-                        vids_with_clips += 1
-                    elif num_found == 1:
-                        print(
-                            f"{Fore.GREEN}Found 1 clip.")
-                        vids_with_clips += 1
-                    else:
-                        print(
-                            f"{Fore.YELLOW}Could not find any clips.")
-
-                # Set values for progress bar
-                # If saving individually, or there is only one video
-                if not combine or vids_with_clips == 1:
-                    if self.is_video:
-                        total_progress = 4 * vids_with_clips * 100
-                    else:
-                        total_progress = 2 * vids_with_clips * 100
-
-                    self.final_bar.reset_total_progress(total_progress)
-                else:
-                    if self.is_video:
-                        total_progress = 4 * (vids_with_clips + 1) * 100
-                    else:
-                        total_progress = 2 * (vids_with_clips + 1) * 100
-
-                self.final_bar.reset_total_progress(total_progress)
-
-                # Save txt file with timestamp info
-                if save_timestamps:
-                    try:
-                        if self.output_text_path.get() != "No file selected!":
-                            txt_path = self.output_text_path.get()
-                        elif os.path.isdir(output_video_path):
-                            txt_path = os.path.join(
-                                output_video_path, "timestamps.txt")
-                        else:
-                            txt_path = os.path.join(os.path.dirname(
-                                output_video_path), "timestamps.txt")
-
-                        def convert_seconds_to_timestamp(seconds: float) -> str:
-                            hours = int(seconds // 3600)
-                            minutes = int((seconds % 3600) // 60)
-                            remaining_seconds = int(
-                                round((seconds % 3600) % 60))
-
-                            if remaining_seconds == 60:
-                                minutes += 1
-                                remaining_seconds = 0
-
-                            if minutes == 60:
-                                hours += 1
-                                minutes = 0
-
-                            timestamp = f"{hours}:{minutes:02}:{remaining_seconds:02}"
-                            return timestamp
-
-                        timestamps_text = ""
-                        found_timestamps = False
-                        for file in dict_list:
-                            timestamps_text += f"{file['filename']}\n"
-
-                            for ts in file['timestamps']:
-                                timestamps_text += f"{convert_seconds_to_timestamp(ts['start'])} - {convert_seconds_to_timestamp(ts['end'])}, confidence: {ts['pred']}\n"
-                                found_timestamps = True
-
-                            timestamps_text += "\n"
-
-                        if found_timestamps:
-                            with open(txt_path, 'w', encoding="utf-8") as file:
-                                file.write(timestamps_text)
-                            print(
-                                f"{Fore.GREEN}Saved timestamps to {txt_path}!")
-                    except:
-                        raise
-
-                print(
-                    f"Compiling and writing to {output_video_path.split('/')[-1]}...")
-                compile_vid(dict_list, output_video_path, merge_clips,
-                            combine, res, self.final_bar, normalize, self.is_video, padding)
-                print(
-                    f"{Fore.GREEN}Wrote final video to {output_video_path.split('/')[-1]}.")
-                messagebox.showinfo(
-                    "Info", f"Video(s) exported to {output_video_path}. Enjoy!")
+                run_pipeline(input_paths, output_video_path, job['options'],
+                             self.post_event, self.progress)
             except Exception as e:
                 raise Exception(
                     "Encountered error during video processing: " + str(e))
@@ -1367,126 +1656,244 @@ class VideoProcessorApp:
                 # so this isn't a huge problem
                 pass
 
+            self.post(self.finish_processing, output_video_path, None)
+
+        except Exception as e:
+            print(f"\n{Fore.RED}FAILURE: " + str(e))
+            self.post(self.finish_processing, None, e)
+
+    def finish_processing(self, output_video_path, error):
+        if error is None:
+            messagebox.showinfo(
+                "Info", f"Video(s) exported to {output_video_path}. Enjoy!")
             if not self.keep_downloaded_vids.get():
                 self.remove_urls_from_list()
+        else:
+            messagebox.showerror("Error", error)
+        self.reenable_disabled_objects()
 
-            self.root.update_idletasks()
-            self.reenable_disabled_objects()
+    def prepare_job(self):
+        # Reads every setting and asks every question up front, on the main
+        # thread, so the worker never has to touch Tk
+        self.reset_preferences_to_file()
 
-        except Exception as e:
-            messagebox.showerror("Error", e)
-            print(f"\n{Fore.RED}FAILURE: " + str(e))
-            self.reenable_disabled_objects()
-            return
+        if not self.uploaded_videos:
+            raise Exception("Please pick some videos to compile.")
 
+        if not self.output_video_path.get() or self.output_video_path.get() == "No location selected!":
+            raise Exception("Please specify an output location.")
 
-class StdoutRedirector:
+        output_video_path = self.output_video_path.get()
+        combine = self.combine_vids.get()
 
-    def __init__(self, text_widget):
-        self.text_widget = text_widget
-        self.text_widget["state"] = tk.DISABLED
+        if combine and os.path.exists(output_video_path):
+            if not messagebox.askyesno("Confirm Overwrite",
+                                       f"Output file \'{output_video_path}\' already exists and will be overwritten. Would you like to continue?"):
+                raise (Exception("Operation cancelled."))
 
-    def write(self, text):
-        self.text_widget["state"] = tk.NORMAL
+        if not combine:
+            for video in self.uploaded_videos:
+                video = video.get_path()
+                temp = str(video.split('/')[-1]).rsplit('.', 1)
+                temp = '.'.join(temp[:-1])
+                temp = str(output_video_path + '/' + temp + "_comped.mp4")
+                if os.path.exists(temp):
+                    if not messagebox.askyesno("Confirm Overwrite",
+                                               f"Output file \'{video}\' already exists and will be overwritten. Would you like to continue?"):
+                        raise (Exception("Operation cancelled."))
+
+        keep_downloaded_vids = self.keep_downloaded_vids.get()
+        download_path = self.download_video_path.get()
+        if not keep_downloaded_vids:
+            download_path = TEMP_DIR
+
+        if any(x.get_is_url() for x in self.uploaded_videos):
+            if keep_downloaded_vids and (not download_path or download_path == "No location selected!"):
+                raise Exception(
+                    "Please set a directory to save downloaded media. You can do this by clicking the gear in the top left.")
+
+            for video in self.uploaded_videos:
+                if not video.get_is_url():
+                    continue
+                media_path = video.get_path()
+                output_path = os.path.join(
+                    download_path,
+                    str(media_path) +
+                    (".mp4" if video.get_type() == "video" else ".mp3")
+                )
+                if os.path.exists(output_path):
+                    if messagebox.askyesno(
+                        title="Media Already Exists",
+                        message=f"The media '{media_path}' already exists in the download directory. Would you like to use the existing file? If not, the media will be redownloaded and overwrite the existing file."""
+                    ):
+                        video.set_path(output_path)
+                        video.set_is_url(False)
+            self.update_listbox()
+
+        res = None
+        if self.use_custom_resolution.get():
+            res = (
+                self.custom_resolution_width_var.get(),
+                self.custom_resolution_height_var.get()
+            )
+
+        padding = None
+        if self.use_custom_padding.get():
+            padding = (
+                self.custom_padding_before.get(),
+                self.custom_padding_after.get()
+            )
 
-        # Check/apply colorama colors
-        # This is the worst code ever written but hey it works
-        if Fore.RED in text:
-            text = text.replace(Fore.RED, "")
-            self.text_widget.tag_configure("red", foreground="red")
-            self.text_widget.insert(tk.END, text, "red")
-        elif Fore.YELLOW in text:
-            text = text.replace(Fore.YELLOW, "")
-            self.text_widget.tag_configure("yellow", foreground="yellow")
-            self.text_widget.insert(tk.END, text, "yellow")
-        elif Fore.GREEN in text:
-            r, g, b = 144, 238, 144
-            light_green = f"#{r:02x}{g:02x}{b:02x}"
-            text = text.replace(Fore.GREEN, "")
-
-            if Style.RESET_ALL in text:
-                middle_index = text.find(Style.RESET_ALL)
-
-                text = text.replace(Style.RESET_ALL, "")
-
-                self.text_widget.insert(tk.END, text)
-
-                start_index = self.text_widget.index("end-1c linestart")
-                middle_index = self.text_widget.index(
-                    f"{start_index}+{middle_index}c")
-
-                self.text_widget.tag_configure(
-                    light_green, foreground=light_green)
-                self.text_widget.tag_configure(
-                    "white", foreground="white")
-
-                self.text_widget.tag_add(
-                    light_green, start_index, middle_index)
-                self.text_widget.tag_add("white", middle_index, tk.END)
+        timestamps_path = None
+        if self.save_txt.get():
+            if self.output_text_path.get() != "No file selected!":
+                timestamps_path = self.output_text_path.get()
+            elif os.path.isdir(output_video_path):
+                timestamps_path = os.path.join(
+                    output_video_path, "timestamps.txt")
             else:
-                self.text_widget.tag_configure(
-                    light_green, foreground=light_green)
-                self.text_widget.insert(tk.END, text, light_green)
-        else:
-            self.text_widget.insert(tk.END, text)
+                timestamps_path = os.path.join(os.path.dirname(
+                    output_video_path), "timestamps.txt")
+
+        # Get model location if in a compiled app
+        selected_model = get_bundle_filepath(
+            os.path.join(self.models_dir, self.model.get()))
+
+        return {
+            'output': output_video_path,
+            'download_path': download_path,
+            'max_quality': self.max_quality.get(),
+            'max_download_speed': self.max_download_speed.get(),
+            'download_workers': self.download_workers.get(),
+            'options': {
+                'precision': self.precision.get(),
+                'block_size': self.block_size.get(),
+                'threshold': self.threshold.get(),
+                'model': selected_model,
+                'memory_budget_mb': self.memory_budget_mb.get(),
+                'batch_size': self.batch_size.get(),
+                'detection_workers': self.detection_workers.get(),
+                'pack_short_files': self.pack_short_files.get(),
+                'merge_clips': self.merge_clips.get(),
+                'combine': combine,
+                'res': res,
+                'normalize': self.normalize_audio.get(),
+                'is_video': self.is_video,
+                'padding': padding,
+                'backend': self.render_backend.get(),
+                'fast_cut': self.fast_cut.get(),
+                'render_workers': self.render_workers.get(),
+                'profile': self.encoder_profile.get(),
+                'timestamps_path': timestamps_path,
+            },
+        }
+
+    def choose_model_variant(self, model):
+        try:
+            self.post(self.model.set, choose_variant(self.models_dir, model))
+        except Exception as e:
+            print(f"{Fore.YELLOW}Could not benchmark model variants: {e}")
 
-        self.text_widget.see(tk.END)  # Scroll to the end of the text
-        self.text_widget["state"] = tk.DISABLED
+    def post(self, fn, *args):
+        # Safe from any thread: fn runs on the Tk thread at the next poll
+        self.ui_queue.put((fn, args))
 
-    def flush(self):
-        return
+    def post_event(self, event, **fields):
+        self.post(self.handle_pipeline_event, event, fields)
+
+    def handle_pipeline_event(self, event, fields):
+        if event == 'progress':
+            self.ui_bar['maximum'] = fields['maximum']
+            self.ui_bar['value'] = fields['value']
+            self.progress_label['text'] = format_progress(fields)
 
+    def poll_ui_queue(self):
+        try:
+            while True:
+                fn, args = self.ui_queue.get_nowait()
+                fn(*args)
+        except queue.Empty:
+            pass
+        self.root.after(UI_POLL_INTERVAL_MS, self.poll_ui_queue)
 
-class FinalRenderBar(ProgressBarLogger):
-    def __init__(self, ui, init_state=None, bars=None, ignored_bars=None, logged_bars='all', min_time_interval=0, ignore_bars_under=0):
-        self.ui = ui
-        self.reset_total_progress(100)
+    def flush_console(self):
+        self.console.flush_to_widget()
+        self.root.after(CONSOLE_FLUSH_INTERVAL_MS, self.flush_console)
 
-        super().__init__(init_state, bars, ignored_bars,
-                         logged_bars, min_time_interval, ignore_bars_under)
 
-    def set_current_progress(self, current_progress):
-        self.current_progress = current_progress
+class StdoutRedirector:
+    # Writes from any thread are buffered and inserted in one go every
+    # CONSOLE_FLUSH_INTERVAL_MS by the Tk thread, instead of once per print()
+
+    LIGHT_GREEN = "#90ee90"
+    COLORS = {
+        Fore.RED: "red",
+        Fore.YELLOW: "yellow",
+        Fore.GREEN: LIGHT_GREEN,
+        Style.RESET_ALL: None,
+    }
+    COLOR_PATTERN = re.compile(
+        "(" + "|".join(re.escape(code) for code in COLORS) + ")")
+
+    def __init__(self, text_widget, max_lines):
+        self.text_widget = text_widget
+        self.text_widget["state"] = tk.DISABLED
+        self.max_lines = max_lines
+        self.pending = []
+        self.lock = threading.Lock()
 
-    def reset_total_progress(self, max_value):
-        self.max_value = max_value
-        self.current_progress = 0
-        self.total_progress = 0
+        for tag in ("red", "yellow", self.LIGHT_GREEN):
+            self.text_widget.tag_configure(tag, foreground=tag)
 
-        self.ui['value'] = self.total_progress
-        self.ui['maximum'] = self.max_value
+    def write(self, text):
+        with self.lock:
+            self.pending.append(text)
 
-    def callback(self, **changes):
-        for (parameter, value) in changes.items():
-            # print ('Parameter %s is now %s' % (parameter, value))
-            return
+    def flush(self):
+        return
 
-    # Normal proglog callback
-    def bars_callback(self, bar, attr, value, old_value=None):
-        self.current_progress = (value / self.bars[bar]['total']) * 100
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+        self.text_widget["state"] = tk.NORMAL
+        self.text_widget.delete("1.0", tk.END)
+        self.text_widget["state"] = tk.DISABLED
 
-        if self.current_progress >= 100:
-            self.total_progress += self.current_progress
-            self.current_progress = 0
+    def flush_to_widget(self):
+        with self.lock:
+            writes, self.pending = self.pending, []
+        if not writes:
+            return
 
-        self.ui['value'] = self.total_progress + self.current_progress
+        # Split into (text, tag) runs. Like before, a color lasts until a
+        # reset or the end of the print() fragment that set it
+        runs = []
+        for text in writes:
+            tag = None
+            for part in self.COLOR_PATTERN.split(text):
+                if part in self.COLORS:
+                    tag = self.COLORS[part]
+                elif part:
+                    if runs and runs[-1][1] == tag:
+                        runs[-1][0].append(part)
+                    else:
+                        runs.append(([part], tag))
 
-    # YT-DLP progress hook stuff
-    def debug(self, msg):
-        pass
+        args = []
+        for parts, tag in runs:
+            args += ["".join(parts), (tag,) if tag else ()]
 
-    def warning(self, msg):
-        pass
+        self.text_widget["state"] = tk.NORMAL
+        self.text_widget.insert(tk.END, *args)
 
-    def error(self, msg):
-        pass
+        # Drop the oldest lines once there are more than max_lines
+        lines = int(self.text_widget.index("end-1c").split(".")[0])
+        if self.max_lines > 0 and lines > self.max_lines:
+            self.text_widget.delete(
+                "1.0", f"{lines - self.max_lines + 1}.0")
 
-    def hook(self, d):
-        if d['status'] == 'downloading':
-            percent_str = re.sub(r'\x1b\[[0-9;]*m', '', d['_percent_str'])
-            percent = float(percent_str.strip('%'))
-            self.current_progress = percent
-        self.ui['value'] = self.current_progress
+        self.text_widget.see(tk.END)  # Scroll to the end of the text
+        self.text_widget["state"] = tk.DISABLED
 
 
 def main():
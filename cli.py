@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import onnxruntime as ort
+from colorama import Fore, init
+
+from compile import RENDER_BACKENDS, individual_output_path
+from config import VERSION
+from ffmpeg_render import ENCODER_PROFILES
+from fingerprint import FINGERPRINT_STRATEGIES, configure_fingerprint
+from model_variants import choose_variant
+from ort_tuning import configure_tuning
+from pipeline import DEFAULT_OPTIONS, format_progress, run_pipeline
+from session_pool import SESSION_POOL
+from timestamp_cache import configure_cache
+from utils import get_bundle_filepath, list_models
+
+MODELS_DIR = "models/"
+
+PROGRESS_MODES = ["text", "json", "none"]
+
+
+class CliReporter:
+    # Pipeline event handler: "text" redraws a percentage on stderr, "json"
+    # writes one event per line to `out`, "none" stays quiet
+    def __init__(self, mode="text", out=sys.stdout):
+        self.mode = mode
+        self.out = out
+        self.last_percent = None
+
+    def __call__(self, event, **fields):
+        if event == 'stage':
+            self.last_percent = None
+        elif event == 'progress':
+            self.report(fields)
+        elif self.mode == "json" and event in ('timestamps', 'timestamps_saved'):
+            emit(self.out, event, **fields)
+
+    def report(self, fields):
+        percent = int(min(100, fields['value'] * 100 / max(1, fields['maximum'])))
+        if self.mode == "json":
+            if percent == self.last_percent:
+                return
+            emit(self.out, "progress", stage=fields['stage'], percent=percent,
+                 rate=None if fields['rate'] is None else round(fields['rate'], 2),
+                 rate_unit=fields['rate_unit'],
+                 eta=None if fields['eta'] is None else round(fields['eta'], 1))
+        elif self.mode == "text":
+            # Events are already rate limited, so the line is redrawn every time
+            sys.stderr.write("\r\033[K" + format_progress(fields))
+            if percent == 100 and self.last_percent != 100:
+                sys.stderr.write("\n")
+            sys.stderr.flush()
+        self.last_percent = percent
+
+
+def emit(out, event, **fields):
+    out.write(json.dumps(dict(event=event, time=round(time.time(), 3), **fields)) + "\n")
+    out.flush()
+
+
+def read_input_list(path):
+    # One media path per line; blank lines and lines starting with # are skipped
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def resolve_model(model):
+    if model is None:
+        models_dir = get_bundle_filepath(MODELS_DIR)
+        models = sorted(list_models(models_dir))
+        if not models:
+            raise Exception(f"No models found in directory {MODELS_DIR}")
+        # The fastest variant of the first model, benchmarked on first use
+        model = choose_variant(models_dir, models[0])
+    if os.path.isfile(model):
+        return model
+    return get_bundle_filepath(os.path.join(MODELS_DIR, model))
+
+
+def parse_size(text):
+    try:
+        width, height = (int(x) for x in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT, ex. 1920x1080")
+    return width, height
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="autocomper-cli",
+        description="Finds clips in media files and writes them to a comp, without the GUI.")
+    parser.add_argument("inputs", nargs="*", help="Input media files")
+    parser.add_argument("-i", "--input-list", action="append", default=[],
+                        help="Text file with one input path per line (can be repeated)")
+    parser.add_argument("-o", "--output", required=True,
+                        help="Output file, or output directory with --separate")
+    parser.add_argument("--audio", action="store_true",
+                        help="Inputs are audio; write mp3 instead of mp4")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Overwrite existing output files")
+    parser.add_argument("--version", action="version", version=f"Autocomper v{VERSION}")
+
+    detection = parser.add_argument_group("detection")
+    detection.add_argument("--model", help=f"Model file name in {MODELS_DIR} or path to an .onnx file")
+    detection.add_argument("--precision", type=int, default=DEFAULT_OPTIONS['precision'])
+    detection.add_argument("--block-size", type=int, default=DEFAULT_OPTIONS['block_size'])
+    detection.add_argument("--threshold", type=float, default=DEFAULT_OPTIONS['threshold'])
+    detection.add_argument("--memory-budget-mb", type=int, default=DEFAULT_OPTIONS['memory_budget_mb'])
+    detection.add_argument("--batch-size", type=int, default=DEFAULT_OPTIONS['batch_size'])
+    detection.add_argument("--detection-workers", type=int, default=DEFAULT_OPTIONS['detection_workers'])
+    detection.add_argument("--pack", action="store_true",
+                           help="Run the model on several short files joined together")
+    detection.add_argument("--ort-provider", choices=ort.get_available_providers(),
+                           help="ONNX Runtime execution provider (default: tuned for this computer)")
+    detection.add_argument("--ort-threads", type=int, default=0,
+                           help="Threads per detection job (default: tuned for this computer)")
+    detection.add_argument("--no-tune", action="store_true",
+                           help="Don't benchmark ONNX Runtime settings for untuned models; use its defaults")
+    detection.add_argument("--log-session-loads", action="store_true",
+                           help="Print how long each model session takes to load")
+
+    cache = parser.add_argument_group("timestamp cache")
+    cache.add_argument("--cache-path", help="SQLite cache file (default: in the app data dir)")
+    cache.add_argument("--cache-max-mb", type=int, default=256)
+    cache.add_argument("--no-cache", action="store_true", help="Don't read or write the on-disk cache")
+    cache.add_argument("--fingerprint", choices=FINGERPRINT_STRATEGIES, default="sampled")
+
+    output = parser.add_argument_group("output")
+    output.add_argument("--separate", action="store_true",
+                        help="Write one comp per input instead of combining them")
+    output.add_argument("--no-merge", action="store_true",
+                        help="Don't merge clips that are close together")
+    output.add_argument("--normalize", action="store_true", help="Normalize audio")
+    output.add_argument("--resolution", type=parse_size, help="Output size, ex. 1920x1080")
+    output.add_argument("--padding", type=float, nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Seconds to add before and after every clip")
+    output.add_argument("--backend", choices=RENDER_BACKENDS, default=DEFAULT_OPTIONS['backend'])
+    output.add_argument("--fast-cut", action="store_true",
+                        help="Stream-copy keyframe-aligned video where possible")
+    output.add_argument("--render-workers", type=int, default=DEFAULT_OPTIONS['render_workers'])
+    output.add_argument("--profile", choices=list(ENCODER_PROFILES), default=DEFAULT_OPTIONS['profile'])
+    output.add_argument("--timestamps", help="Also save the found timestamps to this text file")
+
+    parser.add_argument("--progress", choices=PROGRESS_MODES, default="text",
+                        help="json writes one event per line to stdout and sends log messages to stderr")
+    return parser
+
+
+def run(args, out):
+    events = args.progress == "json"
+
+    inputs = list(args.inputs)
+    for input_list in args.input_list:
+        inputs += read_input_list(input_list)
+    if not inputs:
+        raise Exception("Please pick some media to compile.")
+
+    missing = [x for x in inputs if not os.path.isfile(x)]
+    if missing:
+        raise Exception("Input files not found: " + ", ".join(missing))
+
+    combine = not args.separate
+    output_format = ".mp3" if args.audio else ".mp4"
+    if combine:
+        outputs = [args.output]
+    else:
+        os.makedirs(args.output, exist_ok=True)
+        outputs = [individual_output_path(x, args.output, output_format) for x in inputs]
+    existing = [x for x in outputs if os.path.exists(x)]
+    if existing and not args.overwrite:
+        raise Exception("Output already exists (use --overwrite): " + ", ".join(existing))
+
+    configure_cache(args.cache_path, args.cache_max_mb, enabled=not args.no_cache)
+    configure_fingerprint(args.fingerprint)
+    configure_tuning(not args.no_tune, args.ort_provider, args.ort_threads)
+    SESSION_POOL.log_loads = args.log_session_loads
+    model = resolve_model(args.model)
+
+    if events:
+        emit(out, "start", inputs=inputs, output=args.output, model=model)
+
+    options = {
+        'precision': args.precision,
+        'block_size': args.block_size,
+        'threshold': args.threshold,
+        'model': model,
+        'memory_budget_mb': args.memory_budget_mb,
+        'batch_size': args.batch_size,
+        'detection_workers': args.detection_workers,
+        'pack_short_files': args.pack,
+        'merge_clips': not args.no_merge,
+        'combine': combine,
+        'res': args.resolution,
+        'normalize': args.normalize,
+        'is_video': not args.audio,
+        'padding': args.padding,
+        'backend': args.backend,
+        'fast_cut': args.fast_cut,
+        'render_workers': args.render_workers,
+        'profile': args.profile,
+        'timestamps_path': args.timestamps,
+    }
+    run_pipeline(inputs, args.output, options, CliReporter(args.progress, out))
+
+    written = [x for x in outputs if os.path.exists(x)]
+    print(f"{Fore.GREEN}SUCCESS!")
+    if events:
+        emit(out, "done", outputs=written)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    init()
+
+    # In json mode stdout only carries events; everything printed along the way goes to stderr
+    out = sys.stdout
+    redirect = contextlib.redirect_stdout(sys.stderr) if args.progress == "json" else contextlib.nullcontext()
+    with redirect:
+        try:
+            run(args, out)
+        except Exception as e:
+            print(f"\n{Fore.RED}FAILURE: " + str(e))
+            if args.progress == "json":
+                emit(out, "error", message=str(e))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 import os
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from math import floor
 from shutil import move
 
@@ -11,11 +14,244 @@ from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips,
 from moviepy.video.fx.margin import margin
 from moviepy.video.fx.resize import resize
 
+from ffmpeg_render import (DEFAULT_ENCODER_PROFILE, can_stream_copy, concat_copy,
+                           get_encoder_profile, record_encode_speed, render,
+                           render_fast_cut)
+from utils import LockedBarLogger, MergedBarLogger, probe_media
+
 MERGE_THRESHOLD = 2  # seconds
-BATCH_SIZE = 10
 
+RENDER_BACKENDS = ["ffmpeg", "moviepy"]
+DEFAULT_RENDER_BACKEND = "ffmpeg"
+
+
+def progress_units_per_write(is_video=True, backend=DEFAULT_RENDER_BACKEND):
+    # Progress bar units (of 100) that one written file adds to the logger:
+    # moviepy reports separate audio and video bars, ffmpeg a single one
+    if is_video and backend == "moviepy":
+        return 4
+    return 2
+
+
+def progress_writes(n_videos, combine_vids=True, backend=DEFAULT_RENDER_BACKEND):
+    # Number of files compile_vid writes: moviepy writes every video and then
+    # the combined result, ffmpeg combines straight from the sources
+    if not combine_vids:
+        return n_videos
+    if backend == "moviepy":
+        return n_videos if n_videos == 1 else n_videos + 1
+    return 1
+
+
+def prepare_timestamps(elt, merge_clips=True, padding=None):
+    timestamps = [(d["start"], d["end"])
+                  for d in elt["timestamps"]]
+
+    if padding:
+        before, after = padding
+        if before < 0 or after < 0:
+            raise Exception(
+                "Clip padding cannot be a negative number!")
+        for i, ts in enumerate(timestamps):
+            timestamps[i] = (ts[0] - before, ts[1] + after)
+
+    if merge_clips:
+        i = 0
+        while i < len(timestamps) - 1:
+            if timestamps[i + 1][0] - timestamps[i][1] < MERGE_THRESHOLD:
+                timestamps[i] = (timestamps[i][0],
+                                 timestamps[i + 1][1])
+                timestamps.remove(timestamps[i + 1])
+            else:
+                i += 1
+
+    return timestamps
+
+
+def individual_output_path(filename, output, output_format):
+    temp = str(filename.split('/')[-1]).rsplit('.', 1)
+    temp = '.'.join(temp[:-1])
+    return str(output + '/' + temp + "_comped" + output_format)
+
+
+def largest_size(sizes):
+    # Largest total area; in ties, prioritize larger width over larger height (ex. 1920 x 1080 > 1080 x 1920)
+    return max(sorted(sizes, key=lambda x: x[0])[
+        ::-1], key=lambda x: x[0] * x[1])
+
+
+def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None, logger=None, normalize=False, is_video=True, padding=None, backend=DEFAULT_RENDER_BACKEND, fast_cut=False, workers=1, profile=DEFAULT_ENCODER_PROFILE):
+    if backend == "ffmpeg":
+        return compile_vid_ffmpeg(dict_list, output, merge_clips, combine_vids, res, logger, normalize, is_video, padding, fast_cut, workers, profile)
+    elif backend == "moviepy":
+        return compile_vid_moviepy(dict_list, output, merge_clips, combine_vids, res, logger, normalize, is_video, padding, profile)
+    raise Exception(f"Unknown render backend: {backend}")
+
+
+def load_clips(elt, merge_clips=True, padding=None, is_video=True):
+    # Returns (info, timestamps) with the timestamps clamped to the media's
+    # duration, or (None, []) if the file can't be read
+    info = probe_media(elt["filename"])
+    if info['duration'] is None or (is_video and info['video'] is None) or (not is_video and info['audio'] is None):
+        return None, []
+
+    timestamps = []
+    for start, end in prepare_timestamps(elt, merge_clips, padding):
+        start, end = max(start, 0), min(end, info['duration'])
+        if end > start:
+            timestamps.append((start, end))
+
+    return info, timestamps
+
+
+def write_clips(filename, timestamps, info, output, is_video=True, size=None, normalize=False, fast_cut=False,
+                logger=None, bar="t", threads=None, cancel_event=None, profile=DEFAULT_ENCODER_PROFILE):
+    fps = info['video']['fps'] if is_video else None
+
+    # Fast cut stream-copies whole GOPs, so it only applies when the
+    # frames themselves are left untouched
+    if fast_cut and is_video and size is None and not normalize and can_stream_copy(info):
+        render_fast_cut(filename, timestamps, output, info, logger,
+                        bar=bar, threads=threads, cancel_event=cancel_event, profile=profile)
+    else:
+        render([(filename, timestamps)], output, is_video, size, fps, normalize,
+               has_audio=[info['audio'] is not None], logger=logger,
+               bar=bar, threads=threads, cancel_event=cancel_event, profile=profile)
+
+
+def stream_signature(info, is_video=True):
+    # Everything that has to match for files to be joined without re-encoding
+    audio = info['audio']
+    signature = (audio['codec'], audio['sample_rate'], audio['channels']) if audio else None
+    if is_video:
+        video = info['video']
+        signature = (video['codec'], video['pix_fmt'], video['width'], video['height'],
+                     video['fps'], video['tbn'], signature)
+    return signature
+
+
+def write_sources(sources, outputs, is_video=True, size=None, normalize=False, fast_cut=False, logger=None, workers=1, profile=DEFAULT_ENCODER_PROFILE):
+    # Writes each (filename, timestamps, info) source to its output, up to
+    # `workers` at once, each encoder getting its share of the cores
+    workers = max(1, min(workers, len(sources)))
+    threads = max(1, (os.cpu_count() or 1) // workers) if workers > 1 else None
+    bar_logger = LockedBarLogger(logger) if workers > 1 and logger else logger
+    cancel_event = threading.Event()
+
+    # Parallel workers print whole lines so their messages don't run together
+    line_end = "" if workers == 1 else "\n"
+
+    def write_one(n):
+        filename, timestamps, info = sources[n]
+        filename_stripped = os.path.basename(str(filename))
+
+        print(
+            f"{Fore.GREEN}[{n + 1}/{len(sources)}]{Style.RESET_ALL} Writing all clips for {filename_stripped}...", end=line_end)
+
+        write_clips(filename, timestamps, info, outputs[n], is_video, size, normalize, fast_cut, bar_logger,
+                    bar=f"{n}_t", threads=threads, cancel_event=cancel_event, profile=profile)
+
+        print(f"{Fore.GREEN}Done writing all clips for {filename_stripped}.")
+
+    if workers == 1:
+        for n in range(len(sources)):
+            write_one(n)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(write_one, n) for n in range(len(sources))]
+        for future in futures:
+            future.result()
+    finally:
+        # Stops the remaining workers if a file fails or the calling thread is killed;
+        # waits for them so no ffmpeg process is still writing when the caller cleans up
+        cancel_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def compile_vid_ffmpeg(dict_list, output, merge_clips=True, combine_vids=True, res=None, logger=None, normalize=False, is_video=True, padding=None, fast_cut=False, workers=1, profile=DEFAULT_ENCODER_PROFILE):
+    # Same output as compile_vid_moviepy, but cut, joined and encoded by native
+    # ffmpeg commands instead of piping frames through Python
+    output_format = ".mp4" if is_video else ".mp3"
+
+    sources = []
+    for n, elt in enumerate(dict_list):
+        filename_stripped = os.path.basename(str(elt["filename"]))
+
+        print(
+            f"{Fore.GREEN}[{n + 1}/{len(dict_list)}]{Style.RESET_ALL} Reading clips for {filename_stripped}...", end="")
+
+        info, timestamps = load_clips(elt, merge_clips, padding, is_video)
+        if info is None:
+            print(f"{Fore.RED}Problem reading input video! Continuing...")
+            continue
+
+        if not timestamps:
+            print(f"{Fore.YELLOW}No timestamps found for this video!")
+            continue
+
+        sources.append((elt["filename"], timestamps, info))
+        print(f"{Fore.GREEN}Found {len(timestamps)} clip(s).")
+
+    if not combine_vids:
+        write_sources(sources, [individual_output_path(filename, output, output_format) for filename, _, _ in sources],
+                      is_video, res if is_video else None, normalize, fast_cut, logger, workers, profile)
+        return
+
+    if len(sources) == 0:
+        raise (Exception("No timestamps found for any input media!"))
+
+    print(
+        "Combining media, please do not close the program...", end="")
+
+    signatures = {stream_signature(info, is_video) for _, _, info in sources}
+    first_size = (sources[0][2]['video']['width'], sources[0][2]['video']['height']) if is_video else None
+
+    if len(sources) == 1 and (res is None or not is_video):
+        # Nothing to resize, so this is the same as writing the file on its own
+        filename, timestamps, info = sources[0]
+        write_clips(filename, timestamps, info, output, is_video,
+                    normalize=normalize, fast_cut=fast_cut, logger=logger, profile=profile)
+    elif len(signatures) == 1 and (res is None or not is_video or tuple(res) == first_size):
+        # Every source has the same stream parameters (ex. a playlist downloaded
+        # in one format), so each one's clips can be written on their own and
+        # joined without re-encoding. Their progress is reported as one write.
+        total = sum(end - start for _, timestamps, _ in sources for start, end in timestamps)
+        merged_logger = MergedBarLogger(logger, total)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            tempfiles = [os.path.join(temp_dir, str(n) + output_format) for n in range(len(sources))]
+            write_sources(sources, tempfiles, is_video, None, normalize,
+                          fast_cut, merged_logger, workers, profile)
+            concat_copy(tempfiles, output, is_video)
+        merged_logger.finish()
+    else:
+        size = None
+        fps = None
+        if is_video:
+            # Scaling and padding to the final size happens per source in the filter graph
+            size = res if res is not None else largest_size(
+                [(x['video']['width'], x['video']['height']) for _, _, x in sources])
+            fps = max((x['video']['fps'] or 0) for _, _, x in sources) or None
+
+        render([(filename, timestamps) for filename, timestamps, _ in sources],
+               output, is_video, size, fps, normalize,
+               has_audio=[x['audio'] is not None for _, _, x in sources], logger=logger, profile=profile)
+
+    print(f"{Fore.GREEN}Done combining media.")
+
+
+def compile_vid_moviepy(dict_list, output, merge_clips=True, combine_vids=True, res=None, logger=None, normalize=False, is_video=True, padding=None, profile=DEFAULT_ENCODER_PROFILE):
+    encoder = get_encoder_profile(profile)
+    video_options = {
+        'codec': 'libx264',
+        'audio': True,
+        'preset': encoder['preset'],
+        'ffmpeg_params': ['-crf', str(encoder['crf'])],
+        'threads': encoder['threads'] or None,
+        'audio_bitrate': encoder['audio_bitrate'],
+    }
 
-def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None, logger=None, normalize=False, is_video=True, padding=None):
     output_format = ".mp4" if is_video else ".mp3"
     try:
         with tempfile.TemporaryDirectory() as temp_dir:
@@ -24,8 +260,6 @@ def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None
             for n, elt in enumerate(dict_list):
                 filename = elt["filename"]
                 filename_stripped = os.path.basename(str(elt["filename"]))
-                timestamps = [(d["start"], d["end"])
-                              for d in elt["timestamps"]]
 
                 print(
                     f"{Fore.GREEN}[{n + 1}/{len(dict_list)}]{Style.RESET_ALL} Writing all clips for {filename_stripped}...", end="")
@@ -39,23 +273,7 @@ def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None
                     print(f"{Fore.RED}Problem reading input video! Continuing...")
                     continue
 
-                if padding:
-                    before, after = padding
-                    if before < 0 or after < 0:
-                        raise Exception(
-                            "Clip padding cannot be a negative number!")
-                    for i, ts in enumerate(timestamps):
-                        timestamps[i] = (ts[0] - before, ts[1] + after)
-
-                if merge_clips:
-                    i = 0
-                    while i < len(timestamps) - 1:
-                        if timestamps[i + 1][0] - timestamps[i][1] < MERGE_THRESHOLD:
-                            timestamps[i] = (timestamps[i][0],
-                                             timestamps[i + 1][1])
-                            timestamps.remove(timestamps[i + 1])
-                        else:
-                            i += 1
+                timestamps = prepare_timestamps(elt, merge_clips, padding)
 
                 if not timestamps:
                     print(f"{Fore.YELLOW}No timestamps found for this video!")
@@ -71,9 +289,8 @@ def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None
                     temp = temp_dir + str(n) + output_format
                     tempfiles.append(temp)
                 else:
-                    temp = str(filename.split('/')[-1]).rsplit('.', 1)
-                    temp = '.'.join(temp[:-1])
-                    temp = str(output + '/' + temp + "_comped" + output_format)
+                    temp = individual_output_path(
+                        filename, output, output_format)
 
                 if is_video:
                     final = concatenate_videoclips(clips, method="chain")
@@ -115,11 +332,15 @@ def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None
                     normalized_audio = audio_normalize(audio)
                     final = final.set_audio(normalized_audio)
 
+                start = time.perf_counter()
                 if is_video:
                     final.write_videofile(
-                        temp, logger=logger, codec='libx264', audio=True)
+                        temp, logger=logger, **video_options)
                 else:
-                    final.write_audiofile(temp, logger=logger)
+                    final.write_audiofile(
+                        temp, logger=logger, bitrate=encoder['audio_bitrate'])
+                record_encode_speed(profile, final.duration,
+                                    time.perf_counter() - start)
 
                 for clip in clips:
                     clip.close()
@@ -159,8 +380,7 @@ def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None
                             del tempfiles[0]
                             return
 
-                        max_size = max(sorted(sizes, key=lambda x: x[0])[
-                            ::-1], key=lambda x: x[0] * x[1])
+                        max_size = largest_size(sizes)
 
                     w2, h2 = max_size
                     new_sizes = []
@@ -192,14 +412,17 @@ def compile_vid(dict_list, output, merge_clips=True, combine_vids=True, res=None
                         clips[i] = margin(
                             clips[i], left=horiz_margin[0], right=horiz_margin[1], top=vert_margin[0], bottom=vert_margin[1])
 
+                start = time.perf_counter()
                 if is_video:
                     final = concatenate_videoclips(clips, method="compose")
                     final.write_videofile(
-                        output, codec='libx264', audio=True, logger=logger)
+                        output, logger=logger, **video_options)
                 else:
                     final = concatenate_audioclips(clips)
                     final.write_audiofile(
-                        output, logger=logger)
+                        output, logger=logger, bitrate=encoder['audio_bitrate'])
+                record_encode_speed(profile, final.duration,
+                                    time.perf_counter() - start)
 
                 for clip in clips:
                     clip.close()
@@ -0,0 +1,552 @@
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from proglog import default_bar_logger
+
+from utils import FFMPEG_PATH, get_app_data_dir
+
+is_windows = sys.platform.startswith('win')
+
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_CHANNEL_LAYOUT = "stereo"
+
+VIDEO_CODEC_ARGS = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p']
+VIDEO_AUDIO_CODEC_ARGS = ['-c:a', 'aac']
+AUDIO_CODEC_ARGS = ['-c:a', 'libmp3lame']
+
+# x264 preset and CRF, encoder threads (0 lets the encoder decide) and audio
+# bitrate (None keeps the encoder's default). "balanced" matches the settings
+# that were used before profiles existed.
+ENCODER_PROFILES = {
+    'draft': {'preset': 'ultrafast', 'crf': 28, 'threads': 0, 'audio_bitrate': '128k'},
+    'balanced': {'preset': 'medium', 'crf': 23, 'threads': 0, 'audio_bitrate': None},
+    'archive': {'preset': 'slow', 'crf': 18, 'threads': 0, 'audio_bitrate': '320k'},
+}
+DEFAULT_ENCODER_PROFILE = 'balanced'
+
+ENCODE_STATS_FILE = 'encode_stats.json'
+
+# Video pieces are MPEG-TS because it repeats the codec headers in-stream,
+# so copied and re-encoded pieces can be joined even though their headers differ
+PIECE_FORMAT = ('mpegts', '.ts')
+
+# ffmpeg keeps a demuxer and decoder open for every clip input (tens of MB
+# each at 1080p), so longer comps are rendered this many clips at a time and
+# the pieces joined with stream copy
+RENDER_CHUNK_CLIPS = 10
+
+# loudnorm's default integrated loudness (LUFS) and true peak (dBTP) targets
+LOUDNESS_TARGET = -24.0
+TRUE_PEAK_LIMIT = -2.0
+
+# A source is one input file and the (start, end) ranges to take from it, in
+# seconds; an end of None means "until the end of the file"
+Source = Tuple[str, List[Tuple[float, Optional[float]]]]
+
+_stats_lock = threading.Lock()
+
+
+def get_encoder_profile(profile: Optional[str] = None) -> Dict[str, Any]:
+    if profile is None:
+        profile = DEFAULT_ENCODER_PROFILE
+    if profile not in ENCODER_PROFILES:
+        raise Exception(f"Unknown encoder profile: {profile}")
+    return ENCODER_PROFILES[profile]
+
+
+def codec_args(is_video: bool = True, profile: Optional[str] = None, threads: Optional[int] = None) -> List[str]:
+    # Output codec options for a profile. threads is the share of the CPU given
+    # to this encoder by parallel writes; a profile's own thread count caps it.
+    settings = get_encoder_profile(profile)
+    if is_video:
+        args = VIDEO_CODEC_ARGS + ['-preset', settings['preset'], '-crf', str(settings['crf'])] + \
+            VIDEO_AUDIO_CODEC_ARGS
+    else:
+        args = list(AUDIO_CODEC_ARGS)
+    if settings['audio_bitrate']:
+        args += ['-b:a', settings['audio_bitrate']]
+
+    if settings['threads'] and threads:
+        threads = min(threads, settings['threads'])
+    else:
+        threads = threads or settings['threads']
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+
+def _stats_path() -> str:
+    return os.path.join(get_app_data_dir(), ENCODE_STATS_FILE)
+
+
+def get_encode_stats() -> Dict[str, Dict[str, float]]:
+    # {profile: {'runs', 'media_seconds', 'encode_seconds'}} for every profile used on this machine
+    try:
+        with open(_stats_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_encode_speed(profile: str) -> Optional[float]:
+    # Average seconds of media encoded per second of wall time, if the profile has been used
+    stats = get_encode_stats().get(profile)
+    if not stats or not stats['encode_seconds']:
+        return None
+    return stats['media_seconds'] / stats['encode_seconds']
+
+
+def record_encode_speed(profile: Optional[str], media_seconds: float, encode_seconds: float):
+    if profile is None:
+        profile = DEFAULT_ENCODER_PROFILE
+    with _stats_lock:
+        try:
+            stats = get_encode_stats()
+            entry = stats.setdefault(
+                profile, {'runs': 0, 'media_seconds': 0.0, 'encode_seconds': 0.0})
+            entry['runs'] += 1
+            entry['media_seconds'] += media_seconds
+            entry['encode_seconds'] += encode_seconds
+
+            path = _stats_path()
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(stats, f, indent=2)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            # Only used for display, so never fail a render over it
+            pass
+
+
+def run_ffmpeg(args: List[str], duration: Optional[float] = None, logger=None,
+               progress: Optional[Tuple[float, float]] = None, bar: str = 't', cancel_event=None):
+    # Runs ffmpeg and reports its progress on the 't' bar, like moviepy's writer.
+    # Progress is read from -progress on stdout; stderr is drained on a thread
+    # so a chatty ffmpeg can never block on a full pipe.
+    # When several commands make up one output, pass progress=(offset, total)
+    # in seconds; the caller then sets up and completes the bar itself.
+    # Setting cancel_event stops the command at its next progress update.
+    cmd = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-nostdin',
+           '-y', '-progress', 'pipe:1', '-nostats'] + args
+
+    subprocess_options = {
+        'stdout': subprocess.PIPE,
+        'stderr': subprocess.PIPE,
+    }
+
+    if is_windows:
+        subprocess_options['creationflags'] = subprocess.CREATE_NO_WINDOW
+
+    process = subprocess.Popen(cmd, **subprocess_options)
+
+    errors = collections.deque(maxlen=20)
+
+    def drain_stderr():
+        for line in process.stderr:
+            errors.append(line.decode('utf-8', errors='replace').rstrip())
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    bar_logger = default_bar_logger(logger)
+    if progress is None:
+        offset = 0
+        total = max(1, int(round(duration * 100))) if duration else None
+        if total:
+            bar_logger(**{f"{bar}__total": total})
+            bar_logger(**{f"{bar}__index": 0})
+    else:
+        offset = int(round(progress[0] * 100))
+        total = max(1, int(round(progress[1] * 100)))
+
+    try:
+        for line in process.stdout:
+            if cancel_event is not None and cancel_event.is_set():
+                raise Exception("Rendering was cancelled!")
+            key, _, value = line.decode('utf-8', errors='replace').strip().partition('=')
+            # out_time_us is missing from older builds; out_time_ms is also in microseconds
+            if total and key in ('out_time_us', 'out_time_ms') and value.isdigit():
+                # Completion is only reported once ffmpeg has exited successfully
+                bar_logger(**{f"{bar}__index": min(total - 1, offset + int(value) // 10000)})
+    except BaseException:
+        # Also reached when the worker thread is killed by the user
+        process.terminate()
+        process.wait()
+        raise
+
+    return_code = process.wait()
+    stderr_thread.join()
+
+    if return_code != 0:
+        raise Exception("FFmpeg failed to write the output: " +
+                        ("\n".join(errors) or f"exit code {return_code}"))
+
+    if total and progress is None:
+        bar_logger(**{f"{bar}__index": total})
+
+
+def fit_filter(size: Tuple[int, int]) -> str:
+    # Scale to fit inside size while keeping the aspect ratio, then pad (centered) to exactly size
+    width, height = size
+    return (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1")
+
+
+def build_render_args(sources: List[Source], output: str, is_video: bool = True, size: Optional[Tuple[int, int]] = None,
+                      fps: Optional[float] = None, normalize: bool = False, has_audio: Optional[List[bool]] = None,
+                      threads: Optional[int] = None, profile: Optional[str] = None,
+                      output_format: Optional[str] = None,
+                      gains: Optional[List[float]] = None) -> Tuple[List[str], str, float]:
+    # Builds one ffmpeg invocation that cuts every range out of its source
+    # (input-level -ss/-t seeking, so only the needed parts are decoded) and
+    # joins them with the concat filter. Returns (args, filter_graph, duration).
+    # output_format overrides the container picked from the output's extension.
+    # With gains (dB per source, see measure_gain), normalize applies those
+    # instead of running loudnorm over the clips given here.
+    inputs = []
+    filters = []
+    labels = []
+    duration = 0.0
+
+    audio_format = f"aformat=sample_rates={AUDIO_SAMPLE_RATE}:channel_layouts={AUDIO_CHANNEL_LAYOUT}"
+    streams = "v=1:a=1" if is_video else "v=0:a=1"
+
+    n = 0
+    for source_idx, (filename, segments) in enumerate(sources):
+        source_has_audio = has_audio[source_idx] if has_audio else True
+        source_labels = []
+        for start, end in segments:
+            inputs += ['-ss', f"{start:.3f}"]
+            if end is not None:
+                length = end - start
+                inputs += ['-t', f"{length:.3f}"]
+                duration += length
+            inputs += ['-i', filename]
+
+            if is_video:
+                video_chain = f"[{n}:v]setpts=PTS-STARTPTS"
+                if size:
+                    video_chain += "," + fit_filter(size)
+                if fps:
+                    video_chain += f",fps={fps}"
+                filters.append(video_chain + f"[v{n}]")
+                source_labels.append(f"[v{n}]")
+
+            if source_has_audio:
+                filters.append(f"[{n}:a]asetpts=PTS-STARTPTS,{audio_format}[a{n}]")
+            elif end is not None:
+                filters.append(f"aevalsrc=0:s={AUDIO_SAMPLE_RATE}:c={AUDIO_CHANNEL_LAYOUT}:d={end - start:.3f}[a{n}]")
+            else:
+                raise Exception(f"Cannot add silence for {filename} without knowing its duration!")
+            source_labels.append(f"[a{n}]")
+            n += 1
+
+        if normalize and source_labels:
+            # Each source is normalized on its own, like writing it separately would
+            count = len(source_labels) // (2 if is_video else 1)
+            outputs = f"[vs{source_idx}][as{source_idx}]" if is_video else f"[as{source_idx}]"
+            filters.append("".join(source_labels) + f"concat=n={count}:{streams}" + outputs)
+            normalizer = f"volume={gains[source_idx]:.2f}dB" if gains else "loudnorm"
+            filters.append(f"[as{source_idx}]{normalizer},{audio_format}[an{source_idx}]")
+            source_labels = ([f"[vs{source_idx}]"] if is_video else []) + [f"[an{source_idx}]"]
+
+        labels += source_labels
+
+    if n == 0:
+        raise Exception("No clips to write!")
+
+    count = len(labels) // (2 if is_video else 1)
+    filters.append("".join(labels) + f"concat=n={count}:{streams}" +
+                   ("[vout][aout]" if is_video else "[aout]"))
+
+    filter_graph = ";\n".join(filters)
+
+    args = list(inputs)
+    if is_video:
+        args += ['-map', '[vout]', '-map', '[aout]'] + codec_args(True, profile, threads)
+        # concat drops the frame rate, which would otherwise make ffmpeg
+        # resample to its 25 fps default, so keep the input timing as-is
+        if not fps:
+            args += ['-vsync', 'vfr']
+        if output_format is None:
+            args += ['-movflags', '+faststart']
+    else:
+        args += ['-map', '[aout]'] + codec_args(False, profile, threads)
+    if output_format is not None:
+        args += ['-f', output_format]
+    args.append(output)
+
+    return args, filter_graph, duration
+
+
+def chunk_sources(sources: List[Source], max_clips: int = RENDER_CHUNK_CLIPS) -> List[Tuple[List[Source], List[int]]]:
+    # Splits sources into chunks of at most max_clips ranges, in order; a
+    # source with more ranges than fit is split across chunks. Each chunk
+    # comes with the index in sources of each of its entries.
+    chunks = []
+    current, current_indexes, count = [], [], 0
+    for source_idx, (filename, segments) in enumerate(sources):
+        remaining = list(segments)
+        while remaining:
+            taken, remaining = remaining[:max_clips - count], remaining[max_clips - count:]
+            current.append((filename, taken))
+            current_indexes.append(source_idx)
+            count += len(taken)
+            if count == max_clips:
+                chunks.append((current, current_indexes))
+                current, current_indexes, count = [], [], 0
+    if current:
+        chunks.append((current, current_indexes))
+    return chunks
+
+
+def measure_gain(source: Source) -> float:
+    # Gain in dB that brings all of a source's clips together to
+    # LOUDNESS_TARGET, lowered if needed to keep the true peak under
+    # TRUE_PEAK_LIMIT. Unlike loudnorm's own dynamic mode it is one constant,
+    # so pieces of a source rendered separately still match.
+    filename, segments = source
+    if not segments:
+        return 0.0
+
+    inputs = []
+    for start, end in segments:
+        inputs += ['-ss', f"{start:.3f}"]
+        if end is not None:
+            inputs += ['-t', f"{end - start:.3f}"]
+        inputs += ['-i', filename]
+    labels = "".join(f"[{n}:a]" for n in range(len(segments)))
+    filter_graph = (f"{labels}concat=n={len(segments)}:v=0:a=1,"
+                    f"loudnorm=I={LOUDNESS_TARGET}:TP={TRUE_PEAK_LIMIT}:print_format=json")
+    cmd = [FFMPEG_PATH, '-hide_banner', '-nostdin'] + inputs + \
+        ['-filter_complex', filter_graph, '-f', 'null', '-']
+
+    subprocess_options = {
+        'stdout': subprocess.DEVNULL,
+        'stderr': subprocess.PIPE,
+    }
+
+    if is_windows:
+        subprocess_options['creationflags'] = subprocess.CREATE_NO_WINDOW
+
+    process = subprocess.run(cmd, **subprocess_options)
+    output = process.stderr.decode('utf-8', errors='replace')
+    # loudnorm prints its measurements as the last thing on stderr
+    start = output.rfind('{')
+    if process.returncode != 0 or start == -1:
+        raise Exception(f"FFmpeg failed to measure the loudness of {filename}")
+
+    stats = json.loads(output[start:output.rindex('}') + 1])
+    loudness, true_peak = float(stats['input_i']), float(stats['input_tp'])
+    if loudness == float('-inf'):
+        # Silence stays silent
+        return 0.0
+    return min(LOUDNESS_TARGET - loudness, TRUE_PEAK_LIMIT - true_peak)
+
+
+def _run_filter_graph(args: List[str], filter_graph: str, duration: Optional[float], logger=None,
+                      progress: Optional[Tuple[float, float]] = None, bar: str = 't', cancel_event=None):
+    # The graph grows with every clip, so pass it as a script instead of on the command line
+    script = tempfile.NamedTemporaryFile(
+        'w', suffix='.txt', delete=False, encoding='utf-8')
+    try:
+        with script:
+            script.write(filter_graph)
+        run_ffmpeg(['-filter_complex_script', script.name] + args, duration,
+                   logger, progress, bar, cancel_event)
+    finally:
+        os.remove(script.name)
+
+
+def render(sources: List[Source], output: str, is_video: bool = True, size: Optional[Tuple[int, int]] = None,
+           fps: Optional[float] = None, normalize: bool = False, has_audio: Optional[List[bool]] = None, logger=None,
+           bar: str = 't', threads: Optional[int] = None, cancel_event=None, profile: Optional[str] = None):
+    # With more than RENDER_CHUNK_CLIPS clips, each chunk is encoded to its own
+    # piece first. Each source's loudness is then measured over all of its
+    # clips up front, so a source split across pieces gets one gain.
+    chunks = chunk_sources(sources, RENDER_CHUNK_CLIPS)
+    start = time.perf_counter()
+
+    if len(chunks) <= 1:
+        args, filter_graph, duration = build_render_args(
+            sources, output, is_video, size, fps, normalize, has_audio, threads, profile)
+        _run_filter_graph(args, filter_graph, duration, logger, bar=bar, cancel_event=cancel_event)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_format, extension = PIECE_FORMAT if is_video else (None, os.path.splitext(output)[1])
+            pieces = [os.path.join(temp_dir, str(i) + extension) for i in range(len(chunks))]
+            gains = None
+            if normalize:
+                gains = [measure_gain(source) if not has_audio or has_audio[source_idx] else 0.0
+                         for source_idx, source in enumerate(sources)]
+            builds = [build_render_args(chunk, piece, is_video, size, fps, normalize,
+                                        [has_audio[i] for i in indexes] if has_audio else None,
+                                        threads, profile, output_format,
+                                        [gains[i] for i in indexes] if gains else None)
+                      for (chunk, indexes), piece in zip(chunks, pieces)]
+            duration = sum(chunk_duration for _, _, chunk_duration in builds)
+
+            bar_logger = default_bar_logger(logger)
+            total = max(1, int(round(duration * 100)))
+            if duration:
+                bar_logger(**{f"{bar}__total": total})
+                bar_logger(**{f"{bar}__index": 0})
+
+            done = 0.0
+            for args, filter_graph, chunk_duration in builds:
+                # Ranges without an end make the total unknown, so progress is only shown when it's known
+                _run_filter_graph(args, filter_graph, None, logger,
+                                  (done, duration) if duration else None, bar, cancel_event)
+                done += chunk_duration
+
+            concat_copy(pieces, output, is_video, cancel_event)
+
+            if duration:
+                bar_logger(**{f"{bar}__index": total})
+
+    if duration:
+        record_encode_speed(profile, duration, time.perf_counter() - start)
+
+
+def probe_keyframes(file: str) -> List[float]:
+    # Keyframe times (in seconds) of the first video stream. The packets are
+    # only read, not decoded, so this is about as fast as reading the file.
+    cmd = [FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-nostdin',
+           '-i', file, '-map', '0:v:0', '-c', 'copy', '-f', 'framecrc', '-']
+
+    subprocess_options = {
+        'stdout': subprocess.PIPE,
+        'stderr': subprocess.DEVNULL,
+    }
+
+    if is_windows:
+        subprocess_options['creationflags'] = subprocess.CREATE_NO_WINDOW
+
+    output = subprocess.run(cmd, **subprocess_options).stdout.decode('utf-8', errors='replace')
+
+    time_base = None
+    keyframes = []
+    for line in output.splitlines():
+        if line.startswith('#tb 0:'):
+            num, den = line.split(':', 1)[1].strip().split('/')
+            time_base = int(num) / int(den)
+            continue
+        if line.startswith('#') or time_base is None:
+            continue
+
+        # stream, dts, pts, duration, size, hash[, F=flags]; the flags are only
+        # printed when they differ from a plain keyframe
+        fields = [x.strip() for x in line.split(',')]
+        if len(fields) < 6:
+            continue
+        flags = int(fields[6][2:], 16) if len(fields) > 6 and fields[6].startswith('F=') else 1
+        if flags & 1:
+            keyframes.append(int(fields[2]) * time_base)
+
+    return sorted(keyframes)
+
+
+def can_stream_copy(info) -> bool:
+    # Copied GOPs are joined with pieces re-encoded by codec_args(), so the
+    # source has to be in the same formats
+    video, audio = info['video'], info['audio']
+    return (video is not None and video['codec'] == 'h264' and video['pix_fmt'] == 'yuv420p'
+            and (audio is None or audio['codec'] == 'aac'))
+
+
+def plan_fast_cut(segments: List[Tuple[float, float]], keyframes: List[float],
+                  min_length: float = 0.0) -> List[Tuple[float, float, bool]]:
+    # Splits each segment into (start, end, copy) pieces: the GOPs fully inside
+    # it are stream-copied, and only the head before the first keyframe and the
+    # tail after the last one are re-encoded. Pieces shorter than min_length
+    # (ex. less than a frame) are dropped.
+    pieces = []
+    for start, end in segments:
+        inner = [k for k in keyframes if start <= k <= end]
+        if len(inner) < 2 or inner[-1] - inner[0] < min_length:
+            pieces.append((start, end, False))
+            continue
+
+        first, last = inner[0], inner[-1]
+        if first - start >= min_length:
+            pieces.append((start, first, False))
+        pieces.append((first, last, True))
+        if end - last >= min_length:
+            pieces.append((last, end, False))
+
+    return [piece for piece in pieces if piece[1] - piece[0] > 0]
+
+
+def render_fast_cut(filename: str, segments: List[Tuple[float, float]], output: str, info, logger=None,
+                    bar: str = 't', threads: Optional[int] = None, cancel_event=None, profile: Optional[str] = None):
+    # Lossless-where-possible version of render() for a single source without
+    # resizing or normalization. Pieces are joined with the concat demuxer.
+    fps = info['video']['fps'] or 30
+    pieces = plan_fast_cut(segments, probe_keyframes(filename), 1 / fps)
+    if not pieces:
+        raise Exception("No clips to write!")
+
+    audio = info['audio']
+    duration = sum(end - start for start, end, _ in pieces)
+
+    bar_logger = default_bar_logger(logger)
+    total = max(1, int(round(duration * 100)))
+    bar_logger(**{f"{bar}__total": total})
+    bar_logger(**{f"{bar}__index": 0})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        piece_files = []
+        done = 0.0
+        for i, (start, end, copy) in enumerate(pieces):
+            piece_file = os.path.join(temp_dir, str(i) + PIECE_FORMAT[1])
+            args = []
+            if copy:
+                # Input seeking snaps to the keyframe at or before the position,
+                # so nudge past rounding to land on this GOP and not the previous one
+                args += ['-ss', f"{start + 0.0005:.4f}"]
+            else:
+                args += ['-ss', f"{start:.4f}"]
+            args += ['-t', f"{end - start:.4f}", '-i', filename,
+                     '-map', '0:v:0', '-map', '0:a:0?']
+
+            if copy:
+                args += ['-c', 'copy']
+            else:
+                args += codec_args(True, profile, threads) + ['-vsync', 'vfr']
+                if audio is not None:
+                    args += ['-af', f"aformat=sample_rates={audio['sample_rate']}"
+                             f":channel_layouts={audio['channels']}"]
+
+            run_ffmpeg(args + ['-f', PIECE_FORMAT[0], piece_file], logger=logger,
+                       progress=(done, duration), bar=bar, cancel_event=cancel_event)
+            piece_files.append(piece_file)
+            done += end - start
+
+        concat_copy(piece_files, output, True, cancel_event)
+
+    bar_logger(**{f"{bar}__index": total})
+
+
+def concat_copy(files: List[str], output: str, is_video: bool = True, cancel_event=None):
+    # Joins files whose streams have the same parameters with the concat demuxer, without re-encoding
+    concat_list = tempfile.NamedTemporaryFile(
+        'w', suffix='.txt', delete=False, encoding='utf-8')
+    try:
+        with concat_list:
+            for file in files:
+                escaped = os.path.abspath(file).replace("'", "'\\''")
+                concat_list.write(f"file '{escaped}'\n")
+
+        args = ['-f', 'concat', '-safe', '0', '-i', concat_list.name, '-c', 'copy']
+        if is_video:
+            # Only touches AAC from MPEG-TS pieces; packets already in MP4 form pass through
+            args += ['-bsf:a', 'aac_adtstoasc', '-movflags', '+faststart']
+        run_ffmpeg(args + [output], cancel_event=cancel_event)
+    finally:
+        os.remove(concat_list.name)
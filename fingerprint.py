@@ -0,0 +1,119 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Tuple
+
+from timestamp_cache import get_cache
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+FINGERPRINT_STRATEGIES = ["sampled", "full", "sha256"]
+DEFAULT_FINGERPRINT_STRATEGY = "sampled"
+
+SAMPLE_CHUNK_SIZE = 1024 * 1024  # bytes read from the head, middle and tail
+READ_CHUNK_SIZE = 8 * 1024 * 1024
+
+_strategy = DEFAULT_FINGERPRINT_STRATEGY
+
+# (path, strategy) -> (size, mtime_ns, digest)
+_memo: Dict[Tuple[str, str], Tuple[int, int, str]] = {}
+_memo_lock = threading.Lock()
+
+
+def configure_fingerprint(strategy: str = DEFAULT_FINGERPRINT_STRATEGY):
+    global _strategy
+    if strategy not in FINGERPRINT_STRATEGIES:
+        raise Exception(f"Unknown fingerprint strategy: {strategy}")
+    _strategy = strategy
+
+
+def _new_fast_hash():
+    # Non-cryptographic when xxhash is installed, otherwise the fastest hashlib option
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def sampled_hash(file_path: str) -> str:
+    # Size plus a chunk from the head, middle and tail. The mtime is left out
+    # of the digest (it only guards the memo) so copies of a file on another
+    # machine still share cache entries.
+    size = os.path.getsize(file_path)
+    hash_obj = _new_fast_hash()
+    hash_obj.update(str(size).encode())
+
+    with open(file_path, 'rb') as f:
+        if size <= 3 * SAMPLE_CHUNK_SIZE:
+            hash_obj.update(f.read())
+        else:
+            for position in (0, (size - SAMPLE_CHUNK_SIZE) // 2, size - SAMPLE_CHUNK_SIZE):
+                f.seek(position)
+                hash_obj.update(f.read(SAMPLE_CHUNK_SIZE))
+
+    return hash_obj.hexdigest()
+
+
+def full_hash(file_path: str) -> str:
+    hash_obj = _new_fast_hash()
+    buffer = bytearray(READ_CHUNK_SIZE)
+    view = memoryview(buffer)
+
+    with open(file_path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hash_obj.update(view[:n])
+
+    return hash_obj.hexdigest()
+
+
+def sha256_hash(file_path: str) -> str:
+    hash_obj = hashlib.sha256()
+
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            hash_obj.update(chunk)
+
+    return hash_obj.hexdigest()
+
+
+_HASHERS = {
+    "sampled": sampled_hash,
+    "full": full_hash,
+    "sha256": sha256_hash,
+}
+
+
+def fingerprint_file(file_path: str, strategy: str = None) -> str:
+    strategy = strategy or _strategy
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+
+    with _memo_lock:
+        memo = _memo.get((path, strategy))
+    if memo and memo[:2] == (size, mtime_ns):
+        return memo[2]
+
+    cache = get_cache()
+    stored = cache.get_fingerprint(path, strategy) if cache else None
+    if stored and stored[:2] == (size, mtime_ns):
+        digest = stored[2]
+    else:
+        digest = _HASHERS[strategy](path)
+        # sha256 digests stay unprefixed so they match keys cached before fingerprints were pluggable
+        if strategy != "sha256":
+            digest = f"{strategy}:{digest}"
+        if cache:
+            cache.put_fingerprint(path, strategy, size, mtime_ns, digest)
+
+    with _memo_lock:
+        _memo[(path, strategy)] = (size, mtime_ns, digest)
+    return digest
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import onnxruntime as ort
+
+from utils import get_app_data_dir, list_models, machine_id
+
+# Shipped models are float16, which CPU execution providers often run slower
+# than float32 or INT8 because of the casts. Variants of a model share its
+# base name and differ only by one of these suffixes.
+VARIANT_SUFFIXES = ('_f16', '_f32', '_int8')
+VARIANTS_FILE = 'model_variants.json'
+
+# A variant is only picked if its scores stay this close to the reference model's
+VARIANT_TOLERANCE = 0.05
+BENCHMARK_SECONDS = 10
+BENCHMARK_RUNS = 3
+BENCHMARK_SAMPLE_RATE = 32000
+
+_variants_lock = threading.Lock()
+
+
+def variant_base(model: str) -> str:
+    # "bdetectionmodel_05_01_23_f16.onnx" -> "bdetectionmodel_05_01_23"
+    name = os.path.splitext(os.path.basename(model))[0]
+    for suffix in VARIANT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def find_variants(models_dir: str, base: str) -> List[str]:
+    # File names of every variant of base in models_dir, shipped (float16) first
+    variants = [model for model in list_models(models_dir) if variant_base(model) == base]
+    return sorted(variants, key=lambda model: (not model.endswith('_f16.onnx'), model))
+
+
+# Building variants; needs the onnx package, which the app itself doesn't
+
+def _convert_tensor(tensor):
+    from onnx import TensorProto, numpy_helper
+
+    if tensor.data_type == TensorProto.FLOAT16:
+        tensor.CopyFrom(numpy_helper.from_array(
+            numpy_helper.to_array(tensor).astype(np.float32), tensor.name))
+
+
+def _convert_graph(graph):
+    from onnx import TensorProto
+
+    for tensor in graph.initializer:
+        _convert_tensor(tensor)
+
+    for value in list(graph.input) + list(graph.output) + list(graph.value_info):
+        if value.type.tensor_type.elem_type == TensorProto.FLOAT16:
+            value.type.tensor_type.elem_type = TensorProto.FLOAT
+
+    for node in graph.node:
+        for attribute in node.attribute:
+            if node.op_type == 'Cast' and attribute.name == 'to' and attribute.i == TensorProto.FLOAT16:
+                attribute.i = TensorProto.FLOAT
+            if attribute.HasField('t'):
+                _convert_tensor(attribute.t)
+            if attribute.HasField('g'):
+                _convert_graph(attribute.g)
+            for subgraph in attribute.graphs:
+                _convert_graph(subgraph)
+
+
+def build_variants(model: str, output_dir: Optional[str] = None) -> List[str]:
+    # Writes <base>_f32.onnx (every float16 tensor widened) and
+    # <base>_int8.onnx (dynamically quantized weights) next to the model
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_dir = output_dir or os.path.dirname(os.path.abspath(model))
+    base = os.path.join(output_dir, variant_base(model))
+
+    f32_model = onnx.load(model)
+    _convert_graph(f32_model.graph)
+    # Casts are now float32 -> float32, which the optimizer removes when the session loads
+    onnx.checker.check_model(f32_model)
+    onnx.save(f32_model, base + '_f32.onnx')
+    print(f"Wrote {base + '_f32.onnx'}")
+
+    quantize_dynamic(base + '_f32.onnx', base + '_int8.onnx', weight_type=QuantType.QInt8)
+    print(f"Wrote {base + '_int8.onnx'}")
+
+    return [base + '_f32.onnx', base + '_int8.onnx']
+
+
+# Picking the fastest variant on this machine
+
+def _variants_path() -> str:
+    return os.path.join(get_app_data_dir(), VARIANTS_FILE)
+
+
+def _choice_key(base: str) -> str:
+    return f"{machine_id()}|{base}"
+
+
+def get_variant_choices() -> Dict[str, Dict[str, Any]]:
+    # {"<machine>|<base>": {'model', 'variants', 'timings', 'errors', 'ort_version'}}
+    # for every model benchmarked on any machine using this data dir
+    try:
+        with open(_variants_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_variant_choice(base: str, choice: Dict[str, Any]):
+    with _variants_lock:
+        try:
+            choices = get_variant_choices()
+            choices[_choice_key(base)] = choice
+            path = _variants_path()
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(choices, f, indent=2)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            # The benchmark simply runs again next time
+            pass
+
+
+def benchmark_audio(seconds: int = BENCHMARK_SECONDS) -> np.ndarray:
+    # Fixed noise, tones and bursts, so every variant (and every run) sees the same input
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * BENCHMARK_SAMPLE_RATE) / BENCHMARK_SAMPLE_RATE
+    audio = 0.05 * rng.standard_normal(len(t))
+    audio += 0.3 * np.sin(2 * np.pi * 440 * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+    audio += 0.5 * rng.standard_normal(len(t)) * (np.mod(t, 2) < 0.1)
+    return np.clip(audio, -1, 1).astype(np.float32)[np.newaxis, :]
+
+
+def benchmark_model(model: str, audio: np.ndarray, runs: int = BENCHMARK_RUNS):
+    # (best seconds per run, framewise output) for one model
+    session = ort.InferenceSession(model, providers=ort.get_available_providers())
+    output = session.run(["output"], {"input": audio})[0]  # Warm up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        session.run(["output"], {"input": audio})
+        timings.append(time.perf_counter() - start)
+    return min(timings), output
+
+
+def choose_variant(models_dir: str, model: str, force: bool = False) -> str:
+    # File name of the fastest variant of model whose scores agree with the
+    # first (shipped) variant's. The result is remembered per machine and base
+    # model, and only measured again when the variants or ONNX Runtime change.
+    base = variant_base(model)
+    variants = find_variants(models_dir, base)
+    if len(variants) < 2:
+        return os.path.basename(model)
+
+    choice = get_variant_choices().get(_choice_key(base))
+    if not force and choice and choice['variants'] == variants \
+            and choice['ort_version'] == ort.__version__ and choice['model'] in variants:
+        return choice['model']
+
+    print(f"Finding the fastest version of {base} for this computer...")
+    audio = benchmark_audio()
+    timings, errors = {}, {}
+    reference = None
+    for variant in variants:
+        try:
+            timings[variant], output = benchmark_model(os.path.join(models_dir, variant), audio)
+        except Exception as e:
+            print(f"Could not run {variant}: {e}")
+            continue
+        if reference is None:
+            reference = output
+        errors[variant] = float(np.abs(output - reference).max()) \
+            if output.shape == reference.shape else float('inf')
+
+    usable = [variant for variant in timings if errors[variant] <= VARIANT_TOLERANCE]
+    if not usable:
+        return os.path.basename(model)
+    fastest = min(usable, key=timings.get)
+
+    _save_variant_choice(base, {
+        'model': fastest,
+        'variants': variants,
+        'timings': timings,
+        'errors': errors,
+        'ort_version': ort.__version__,
+    })
+    print(f"Using {fastest} ({timings[fastest] * 1000:.0f} ms per {BENCHMARK_SECONDS} s of audio).")
+    return fastest
+
+
+def get_chosen_variant(model: str) -> Optional[str]:
+    # The remembered choice for model's base on this machine, without benchmarking
+    choice = get_variant_choices().get(_choice_key(variant_base(model)))
+    return choice['model'] if choice else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds float32 and INT8 variants of a model and picks the fastest for this computer.")
+    parser.add_argument("model", help="Shipped model, ex. models/bdetectionmodel_05_01_23_f16.onnx")
+    parser.add_argument("--output-dir", help="Where to write the variants (default: next to the model)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Benchmark the variants afterwards and remember the fastest")
+    args = parser.parse_args()
+
+    variants = build_variants(args.model, args.output_dir)
+    if args.benchmark:
+        choose_variant(os.path.dirname(variants[0]), args.model, force=True)
+
+
+if __name__ == '__main__':
+    main()
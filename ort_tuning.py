@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import onnxruntime as ort
+
+from model_variants import BENCHMARK_SECONDS, benchmark_audio
+from utils import get_app_data_dir, machine_id
+
+TUNING_FILE = 'ort_tuning.json'
+OPTIMIZED_MODELS_DIR = 'ort_cache'
+TUNING_RUNS = 2
+# The optimized-model cache is only used if loading from it is at least this much faster
+OPTIMIZED_LOAD_SPEEDUP = 1.25
+# A setting only replaces the current best if it is at least this much faster, so noise doesn't pick it
+TUNING_MIN_GAIN = 0.05
+# Providers that don't run the model on this computer
+SKIPPED_PROVIDERS = ('CPUExecutionProvider', 'AzureExecutionProvider')
+
+AUTO_PROVIDER = "Auto"
+
+# Overrides from the settings or command line; None/0 means use the tuned value
+_tuning_settings = {
+    'enabled': True,
+    'provider': None,
+    'threads': 0,
+}
+_tuning_lock = threading.Lock()
+# Profiles already read or tuned in this process, by profile key
+_profiles = {}
+
+
+def configure_tuning(enabled: bool = True, provider: Optional[str] = None, threads: int = 0):
+    _tuning_settings['enabled'] = enabled
+    _tuning_settings['provider'] = None if provider in (None, "", AUTO_PROVIDER) else provider
+    _tuning_settings['threads'] = max(0, threads or 0)
+
+
+def _profile_key(model: str) -> str:
+    return f"{machine_id()}|{os.path.basename(model)}"
+
+
+def _tuning_path() -> str:
+    return os.path.join(get_app_data_dir(), TUNING_FILE)
+
+
+def get_profiles() -> Dict[str, Dict[str, Any]]:
+    # {"<machine>|<model file>": profile} for every model tuned on any machine using this data dir
+    try:
+        with open(_tuning_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_profile(key: str, profile: Dict[str, Any]):
+    try:
+        profiles = get_profiles()
+        profiles[key] = profile
+        path = _tuning_path()
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        # Tuning simply runs again next time
+        pass
+
+
+def profile_session_options(profile: Dict[str, Any]) -> Dict[str, Any]:
+    # SessionOptions attributes for a stored profile
+    return {
+        'intra_op_num_threads': profile['intra_op_num_threads'],
+        'inter_op_num_threads': profile['inter_op_num_threads'],
+        'execution_mode': getattr(ort.ExecutionMode, profile['execution_mode']),
+        'enable_cpu_mem_arena': profile['enable_cpu_mem_arena'],
+    }
+
+
+def _load_session(model: str, providers: List[str], options: Dict[str, Any]) -> Tuple[ort.InferenceSession, float]:
+    from session_pool import DEFAULT_SESSION_OPTIONS, make_session_options
+
+    start = time.perf_counter()
+    session = ort.InferenceSession(
+        model, make_session_options(dict(DEFAULT_SESSION_OPTIONS, **options)), providers=providers)
+    return session, time.perf_counter() - start
+
+
+def _time_profile(model: str, profile: Dict[str, Any], audio) -> Optional[float]:
+    # Best seconds per run of the synthetic block, or None if the combination doesn't work here
+    try:
+        session, _ = _load_session(model, profile['providers'], profile_session_options(profile))
+        session.run(["output"], {"input": audio})  # Warm up
+        timings = []
+        for _ in range(TUNING_RUNS):
+            start = time.perf_counter()
+            session.run(["output"], {"input": audio})
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+    except Exception:
+        return None
+
+
+def _thread_counts() -> List[int]:
+    cores = os.cpu_count() or 1
+    return sorted({n for n in (1, 2, 4, cores // 2, cores) if 1 <= n <= cores})
+
+
+def _optimized_model_path(model: str, profile: Dict[str, Any]) -> str:
+    # Optimized graphs depend on the providers, the ONNX Runtime build and the model file
+    stat = os.stat(model)
+    digest = hashlib.sha1(json.dumps(
+        [os.path.abspath(model), stat.st_size, stat.st_mtime_ns, profile['providers'], ort.__version__]
+    ).encode('utf-8')).hexdigest()[:16]
+    name = f"{os.path.splitext(os.path.basename(model))[0]}-{digest}.onnx"
+    return os.path.join(get_app_data_dir(), OPTIMIZED_MODELS_DIR, name)
+
+
+def tune(model: str) -> Dict[str, Any]:
+    # Searches one setting at a time, keeping the best so far: providers,
+    # then intra-op threads, then execution mode, then the memory arena.
+    # Finally checks whether loading a saved optimized model is worth it.
+    print(f"Tuning ONNX Runtime for {os.path.basename(model)} on this computer...")
+    audio = benchmark_audio()
+
+    profile = {
+        'providers': ['CPUExecutionProvider'],
+        'intra_op_num_threads': 0,
+        'inter_op_num_threads': 0,
+        'execution_mode': 'ORT_SEQUENTIAL',
+        'enable_cpu_mem_arena': True,
+    }
+    best = _time_profile(model, profile, audio)
+
+    def try_candidates(candidates):
+        nonlocal profile, best
+        for changes in candidates:
+            candidate = dict(profile, **changes)
+            timing = _time_profile(model, candidate, audio)
+            if timing is not None and (best is None or timing < best * (1 - TUNING_MIN_GAIN)):
+                profile, best = candidate, timing
+
+    available = ort.get_available_providers()
+    try_candidates({'providers': [provider, 'CPUExecutionProvider']}
+                   for provider in available if provider not in SKIPPED_PROVIDERS)
+    try_candidates({'intra_op_num_threads': threads} for threads in _thread_counts())
+    try_candidates([{'execution_mode': 'ORT_PARALLEL', 'inter_op_num_threads': 2}])
+    try_candidates([{'enable_cpu_mem_arena': False}])
+
+    if best is None:
+        raise Exception(f"Could not run {os.path.basename(model)} with any execution provider!")
+
+    # Loading a graph that was already optimized skips the optimizer on later runs
+    profile['optimized_model_cache'] = False
+    try:
+        options = profile_session_options(profile)
+        path = _optimized_model_path(model, profile)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Quiet the warning that the saved graph is specific to this computer; that's why it's kept per machine
+        _, load_time = _load_session(model, profile['providers'],
+                                     dict(options, optimized_model_filepath=path, log_severity_level=3))
+        _, cached_load_time = _load_session(path, profile['providers'], dict(
+            options, graph_optimization_level=ort.GraphOptimizationLevel.ORT_DISABLE_ALL))
+        profile['optimized_model_cache'] = load_time > cached_load_time * OPTIMIZED_LOAD_SPEEDUP
+        if not profile['optimized_model_cache']:
+            os.remove(path)
+    except Exception:
+        pass
+
+    profile['block_time'] = best
+    profile['ort_version'] = ort.__version__
+    print(f"Using {', '.join(profile['providers'])} with "
+          f"{profile['intra_op_num_threads'] or 'default'} thread(s) "
+          f"({best * 1000:.0f} ms per {BENCHMARK_SECONDS} s block).")
+    return profile
+
+
+def get_tuned_profile(model: str) -> Optional[Dict[str, Any]]:
+    # The saved profile for model on this machine, tuning it first if there is none yet
+    key = _profile_key(model)
+    # Parallel detection workers wait for one tuning run instead of each starting their own
+    with _tuning_lock:
+        if key in _profiles:
+            return _profiles[key]
+        profile = get_profiles().get(key)
+        if profile is None or profile.get('ort_version') != ort.__version__:
+            if not _tuning_settings['enabled']:
+                return None
+            profile = tune(model)
+            _save_profile(key, profile)
+        _profiles[key] = profile
+    return profile
+
+
+def session_settings(model: str) -> Tuple[str, Optional[List[str]], Dict[str, Any]]:
+    # (file to load, providers, SessionOptions attributes) for a model, from
+    # its tuned profile with the configured provider on top. Providers are
+    # None when nothing was tuned or chosen, meaning every available one.
+    provider = _tuning_settings['provider']
+    threads = _tuning_settings['threads']
+
+    profile = None
+    if provider is None or not threads:
+        profile = get_tuned_profile(model)
+
+    load_path = model
+    providers = None
+    options = {}
+    if profile is not None:
+        providers = profile['providers']
+        options = profile_session_options(profile)
+        if profile.get('optimized_model_cache') and provider is None:
+            path = _optimized_model_path(model, profile)
+            if os.path.isfile(path):
+                load_path = path
+                options['graph_optimization_level'] = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            else:
+                options['optimized_model_filepath'] = path
+
+    if provider is not None:
+        providers = [provider] if provider == 'CPUExecutionProvider' else [provider, 'CPUExecutionProvider']
+
+    return load_path, providers, options
+
+
+def session_overrides() -> Dict[str, Any]:
+    # SessionOptions attributes the user set explicitly. These go on top of
+    # everything else, including the thread split between parallel workers.
+    threads = _tuning_settings['threads']
+    return {'intra_op_num_threads': threads} if threads else {}
@@ -0,0 +1,370 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from colorama import Fore, Style
+from proglog import ProgressBarLogger
+
+from compile import (DEFAULT_RENDER_BACKEND, compile_vid,
+                     progress_units_per_write, progress_writes)
+from ffmpeg_render import DEFAULT_ENCODER_PROFILE
+from sound_reader import DEFAULT_MEMORY_BUDGET_MB, get_timestamps_parallel
+from utils import (convert_seconds_to_timestamp, download_audio, download_video,
+                   format_timestamps_text)
+
+FOCUS_IDX = 58
+
+DEFAULT_OPTIONS = {
+    # Detection
+    'precision': 100,
+    'block_size': 600,
+    'threshold': 0.90,
+    'model': None,
+    'memory_budget_mb': DEFAULT_MEMORY_BUDGET_MB,
+    'batch_size': 1,
+    'detection_workers': 1,
+    'pack_short_files': False,
+    # Compiling
+    'merge_clips': True,
+    'combine': True,
+    'res': None,
+    'normalize': False,
+    'is_video': True,
+    'padding': None,
+    'backend': DEFAULT_RENDER_BACKEND,
+    'fast_cut': False,
+    'render_workers': 1,
+    'profile': DEFAULT_ENCODER_PROFILE,
+    # Also write the found timestamps to this text file
+    'timestamps_path': None,
+}
+
+
+def ignore_event(event, **fields):
+    return
+
+
+STAGE_NAMES = {
+    'download': "Downloading",
+    'detect': "Finding clips",
+    'render': "Rendering",
+}
+
+# How to measure throughput per stage: bars whose name ends with the suffix
+# are counted, their index deltas are multiplied by the scale and reported
+# in the unit. ffmpeg bars count centiseconds of media, moviepy's count frames
+# (video) or chunks (audio). Downloads use the speed yt-dlp reports.
+DETECT_RATE = ('block', 1, "blocks/s")
+RENDER_RATES = {
+    'ffmpeg': ('t', 0.01, "x realtime"),
+    'moviepy': ('t', 1, "frames/s"),
+}
+MOVIEPY_AUDIO_RATE = ('chunk', 1, "chunks/s")
+DOWNLOAD_RATE = (None, 1, "MB/s")
+
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_RETRY_DELAY = 2  # seconds, doubled after every failed attempt
+
+# Progress events are sent at most this often, besides stage changes and
+# finished steps
+PROGRESS_MIN_INTERVAL = 0.1  # seconds
+RATE_SMOOTHING = 0.3
+
+
+def format_progress(fields):
+    # ex. "Rendering: 42% - 3.1x realtime - 0:01:23 left"
+    text = f"{STAGE_NAMES.get(fields['stage'], fields['stage'] or 'Working')}: " \
+        f"{int(min(100, fields['value'] * 100 / max(1, fields['maximum'])))}%"
+    if fields.get('rate'):
+        # "3.1x realtime", but "25.0 blocks/s"
+        separator = "" if fields['rate_unit'].startswith("x ") else " "
+        text += f" - {fields['rate']:.1f}{separator}{fields['rate_unit']}"
+    if fields.get('eta') is not None:
+        text += f" - {convert_seconds_to_timestamp(fields['eta'])} left"
+    return text
+
+
+class PipelineProgress(ProgressBarLogger):
+    """Turns proglog bar updates (and yt-dlp download hooks) into events.
+
+    Every bar adds 100 units when its total is set and another 100 when it
+    completes, so callers size a stage with reset_total_progress() and get
+    ``progress`` events with the running value and maximum, a throughput and
+    an ETA. Bars running in parallel each count towards the value. Events are
+    passed to ``on_event(event, **fields)`` on whichever thread made the
+    update, at most every PROGRESS_MIN_INTERVAL seconds.
+    """
+
+    def __init__(self, on_event=ignore_event):
+        super().__init__()
+        self.on_event = on_event
+        self.lock = threading.RLock()
+        self.stage = None
+        self.rate_spec = None
+        self.reset_total_progress(100)
+
+    def reset_total_progress(self, max_value, stage=None, rate=None):
+        with self.lock:
+            self.max_value = max_value
+            self.done = 0
+            # Fraction finished of every bar that has started but not completed
+            self.active = {}
+            if stage is not None:
+                self.stage = stage
+                self.rate_spec = rate
+
+            self.started = time.monotonic()
+            self.last_emit = 0
+            self.last_indices = {}
+            self.counted = 0
+            self.counted_since = self.started
+            self.rate = None
+            self.speeds = {}
+
+            self.on_event('stage', stage=self.stage, total=self.max_value)
+            self.emit_progress(force=True)
+
+    def __call__(self, **kw):
+        # Bars are updated from several worker threads at once
+        with self.lock:
+            super().__call__(**kw)
+
+    def value(self):
+        return self.done + 100 * sum(self.active.values())
+
+    def update_rate(self, now):
+        elapsed = now - self.counted_since
+        if elapsed <= 0 or self.rate_spec is None or self.rate_spec[0] is None:
+            return
+        rate = self.counted * self.rate_spec[1] / elapsed
+        self.rate = rate if self.rate is None else \
+            RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate
+        self.counted = 0
+        self.counted_since = now
+
+    def emit_progress(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_emit < PROGRESS_MIN_INTERVAL:
+            return
+        self.last_emit = now
+        self.update_rate(now)
+
+        value = self.value()
+        # Same model for every stage: time so far, scaled by what's left
+        eta = None
+        fraction = value / max(1, self.max_value)
+        if 0.01 < fraction < 1:
+            eta = (now - self.started) * (1 - fraction) / fraction
+
+        self.on_event('progress', stage=self.stage, value=value, maximum=self.max_value,
+                      rate=self.rate, rate_unit=self.rate_spec[2] if self.rate_spec else None,
+                      eta=eta)
+
+    # Normal proglog callback
+    def bars_callback(self, bar, attr, value, old_value=None):
+        with self.lock:
+            total = self.bars[bar]['total']
+            if attr not in ('total', 'index'):
+                return
+            if attr == 'total':
+                self.done += 100
+                self.active[bar] = 0
+                self.last_indices[bar] = 0
+                self.emit_progress()
+                return
+
+            if self.rate_spec is not None and self.rate_spec[0] and bar.endswith(self.rate_spec[0]):
+                self.counted += max(0, value - self.last_indices.get(bar, 0))
+                self.last_indices[bar] = value
+
+            if total and value >= total:
+                self.done += 100
+                self.active.pop(bar, None)
+                self.on_event('step_done', stage=self.stage, bar=bar)
+                self.emit_progress(force=True)
+            else:
+                self.active[bar] = value / total if total else 0
+                self.emit_progress()
+
+    # YT-DLP logger and progress hook
+    def debug(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+    def hook(self, d, key='download'):
+        with self.lock:
+            if d['status'] == 'downloading':
+                percent_str = re.sub(r'\x1b\[[0-9;]*m', '', d['_percent_str'])
+                self.active[key] = float(percent_str.strip('%')) / 100
+                self.speeds[key] = d.get('speed') or 0
+                self.rate = sum(self.speeds.values()) / (1024 * 1024)
+            self.emit_progress(force=d['status'] != 'downloading')
+
+    def finish_download(self, key):
+        # Items of a download pool count 100 units each once they're done
+        with self.lock:
+            self.done += 100
+            self.active.pop(key, None)
+            self.speeds.pop(key, None)
+            self.on_event('step_done', stage=self.stage, bar=key)
+            self.emit_progress(force=True)
+
+
+class DownloadItemLogger:
+    # yt-dlp logger and progress hook for one item of download_media, so
+    # parallel downloads each get their share of the progress bar
+    def __init__(self, progress, key, cancel_event):
+        self.progress = progress
+        self.key = key
+        self.cancel_event = cancel_event
+
+    def reset_total_progress(self, max_value, stage=None, rate=None):
+        # The pool sizes the progress bar for every item at once
+        return
+
+    def debug(self, msg):
+        pass
+
+    def warning(self, msg):
+        pass
+
+    def error(self, msg):
+        pass
+
+    def hook(self, d):
+        # Raising from a hook makes yt-dlp abort the download
+        if self.cancel_event.is_set():
+            raise Exception("Download was cancelled!")
+        self.progress.hook(d, self.key)
+
+
+def download_media(items, download_path, max_quality="No Limit", max_speed=0, workers=1, progress=None):
+    # Downloads (media_type, url, name) items with up to `workers` at once.
+    # max_speed (KB/s, 0 for no limit) is split between the workers, and
+    # failed items are retried with a growing delay. Returns a
+    # (success, result) pair for each item, in order.
+    if progress is None:
+        progress = PipelineProgress()
+    workers = max(1, min(workers, len(items)))
+    if max_speed > 0:
+        max_speed = max(1, max_speed // workers)
+    cancel_event = threading.Event()
+    progress.reset_total_progress(len(items) * 100, 'download', DOWNLOAD_RATE)
+
+    def download_one(n):
+        media_type, url, name = items[n]
+        logger = DownloadItemLogger(progress, f"{n}_download", cancel_event)
+        print(f"{Fore.GREEN}[{n + 1}/{len(items)}]{Style.RESET_ALL} Downloading {name}")
+
+        delay = DOWNLOAD_RETRY_DELAY
+        for attempt in range(DOWNLOAD_RETRIES):
+            if media_type == 'video':
+                success, result = download_video(
+                    url, name, download_path, max_quality, max_speed, logger, n_retries=1)
+            else:
+                success, result = download_audio(
+                    url, name, download_path, max_speed, logger, n_retries=1)
+            if success or cancel_event.is_set():
+                break
+            if attempt + 1 < DOWNLOAD_RETRIES:
+                print(f"{Fore.YELLOW}Download of {name} failed, retrying in {delay}s...")
+                if cancel_event.wait(delay):
+                    break
+                delay *= 2
+
+        progress.finish_download(f"{n}_download")
+        if success:
+            print(f"{Fore.GREEN}Done downloading {name}!" if result else
+                  f"{Fore.YELLOW}No video found for {name}, skipping")
+        return success, result
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(download_one, n) for n in range(len(items))]
+        return [future.result() for future in futures]
+    finally:
+        # Aborts the remaining downloads if the calling thread is killed
+        cancel_event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def run_pipeline(inputs, output, options=None, on_event=ignore_event, progress=None):
+    # Detects clips in every input and compiles them to output. Only plain
+    # values go in and events come out, so any front end can drive it from a
+    # worker thread. Returns the timestamps found for each input.
+    options = dict(DEFAULT_OPTIONS, **(options or {}))
+    if progress is None:
+        progress = PipelineProgress(on_event)
+
+    if not inputs:
+        raise Exception("Please pick some videos to compile.")
+
+    vids_with_clips = 0
+
+    def report_timestamps(i, result):
+        nonlocal vids_with_clips
+        timestamps, used_existing_data = result
+        print(
+            f"{Fore.GREEN}[{i + 1}/{len(inputs)}]{Style.RESET_ALL} Got timestamps for {os.path.basename(inputs[i])}")
+        if used_existing_data:
+            print(f"{Fore.GREEN}Using existing timestamp data from previous run.")
+        num_found = len(timestamps['timestamps'])
+        if num_found > 1:
+            print(
+                f"{Fore.GREEN}Found {num_found} clips.")
+            vids_with_clips += 1
+        elif num_found == 1:
+            print(
+                f"{Fore.GREEN}Found 1 clip.")
+            vids_with_clips += 1
+        else:
+            print(
+                f"{Fore.YELLOW}Could not find any clips.")
+        on_event('timestamps', index=i, file=inputs[i],
+                 timestamps=timestamps['timestamps'], cached=used_existing_data)
+
+    print(f"Getting timestamps for {len(inputs)} file(s)...")
+    on_event('detect_started', files=list(inputs))
+    progress.reset_total_progress(len(inputs) * 100 * 2, 'detect', DETECT_RATE)
+    results = get_timestamps_parallel(
+        inputs, options['precision'], options['block_size'], options['threshold'], FOCUS_IDX,
+        options['model'], progress, options['memory_budget_mb'], options['batch_size'],
+        options['detection_workers'], on_result=report_timestamps, pack=options['pack_short_files'])
+    dict_list = [timestamps for timestamps, _ in results]
+
+    if options['timestamps_path']:
+        timestamps_text = format_timestamps_text(dict_list)
+        if timestamps_text:
+            with open(options['timestamps_path'], 'w', encoding="utf-8") as file:
+                file.write(timestamps_text)
+            print(
+                f"{Fore.GREEN}Saved timestamps to {options['timestamps_path']}!")
+            on_event('timestamps_saved', path=options['timestamps_path'])
+
+    if vids_with_clips == 0:
+        raise Exception("No timestamps found for any input media!")
+
+    progress.reset_total_progress(
+        progress_units_per_write(options['is_video'], options['backend']) *
+        progress_writes(vids_with_clips, options['combine'], options['backend']) * 100, 'render',
+        RENDER_RATES[options['backend']] if options['is_video'] or options['backend'] != 'moviepy'
+        else MOVIEPY_AUDIO_RATE)
+
+    print(
+        f"Compiling and writing to {os.path.basename(output)}...")
+    on_event('render_started', output=output)
+    compile_vid(dict_list, output, options['merge_clips'], options['combine'], options['res'], progress,
+                options['normalize'], options['is_video'], options['padding'], options['backend'],
+                options['fast_cut'], options['render_workers'], options['profile'])
+    print(
+        f"{Fore.GREEN}Wrote final video to {os.path.basename(output)}.")
+    on_event('done', output=output)
+
+    return dict_list
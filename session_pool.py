@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+import onnxruntime as ort
+
+from ort_tuning import session_overrides, session_settings
+
+MAX_SESSIONS = 2
+SESSION_IDLE_TIMEOUT = 600  # seconds
+
+DEFAULT_SESSION_OPTIONS = {
+    'graph_optimization_level': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def make_session_options(options: Dict[str, Any]) -> ort.SessionOptions:
+    sess_options = ort.SessionOptions()
+    for name, value in options.items():
+        setattr(sess_options, name, value)
+    return sess_options
+
+
+class SessionPool:
+    """Process-wide registry of ONNX inference sessions.
+
+    Sessions are keyed by model path, providers and session options, shared
+    between threads (``InferenceSession.run`` is thread-safe) and evicted when
+    they have not been used recently. Concurrent runs on one session share its
+    intra-op thread pool, so parallel workers each ask for their own copy with
+    ``worker``; all copies of a session count as one towards ``max_sessions``.
+
+    Load times and reuse counts are available from ``get_stats``; set
+    ``log_loads`` to also print each load.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 log_loads: bool = False):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.log_loads = log_loads
+
+        self._sessions: 'OrderedDict[tuple, Dict[str, Any]]' = OrderedDict()
+        self._key_locks: Dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        # Cumulative metrics, kept across evictions
+        self.loads = 0
+        self.load_time_total = 0.0
+
+    def _make_key(self, model: str, providers: Sequence[str], options: Dict[str, Any], worker: int) -> tuple:
+        return (
+            os.path.abspath(model),
+            tuple(providers),
+            tuple(sorted((k, str(v)) for k, v in options.items())),
+            worker
+        )
+
+    def get(self, model: str, providers: Optional[Sequence[str]] = None, options: Optional[Dict[str, Any]] = None, worker: int = 0) -> ort.InferenceSession:
+        # The machine's tuned profile (see ort_tuning) fills in whatever the
+        # caller leaves unset, and the user's own settings override both
+        load_path, tuned_providers, tuned_options = session_settings(model)
+        if providers is None:
+            providers = tuned_providers or ort.get_available_providers()
+        options = {**DEFAULT_SESSION_OPTIONS, **tuned_options, **(options or {}), **session_overrides()}
+        key = self._make_key(model, providers, options, worker)
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Only one thread builds a given session; the others wait and reuse it
+        with key_lock:
+            with self._lock:
+                self._evict_idle()
+                entry = self._sessions.get(key)
+                if entry is not None:
+                    self._sessions.move_to_end(key)
+                    entry['last_used'] = time.monotonic()
+                    entry['hits'] += 1
+                    return entry['session']
+
+            start = time.perf_counter()
+            session = ort.InferenceSession(
+                load_path,
+                make_session_options(options),
+                providers=list(providers)
+            )
+            load_time = time.perf_counter() - start
+            # Copies for the other workers load alongside and take about as long
+            if self.log_loads and worker == 0:
+                print(f"Loaded {os.path.basename(model)} in {load_time:.2f} s.")
+
+            with self._lock:
+                self._sessions[key] = {
+                    'session': session,
+                    'model': model,
+                    'providers': tuple(providers),
+                    'options': options,
+                    'worker': worker,
+                    'load_time': load_time,
+                    'hits': 0,
+                    'last_used': time.monotonic(),
+                }
+                self.loads += 1
+                self.load_time_total += load_time
+                while len({k[:-1] for k in self._sessions}) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+
+            return session
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for key in [k for k, v in self._sessions.items() if now - v['last_used'] > self.idle_timeout]:
+            del self._sessions[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'loads': self.loads,
+                'load_time_total': self.load_time_total,
+                'sessions': [
+                    {
+                        'model': entry['model'],
+                        'providers': entry['providers'],
+                        'worker': entry['worker'],
+                        'load_time': entry['load_time'],
+                        'hits': entry['hits'],
+                        'idle_time': time.monotonic() - entry['last_used'],
+                    }
+                    for entry in self._sessions.values()
+                ],
+            }
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+SESSION_POOL = SessionPool()
@@ -18,5 +18,8 @@ setup(
                            'packages': packages, 'include_files': includefiles}},
     executables=[Executable('autocomper.py',
                             base=base,
+                            icon="app.ico"),
+                 Executable('cli.py',
+                            target_name='autocomper-cli',
                             icon="app.ico")]
 )
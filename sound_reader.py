@@ -1,16 +1,36 @@
 #!/usr/bin/env python
-import hashlib
+import math
+import os
+import queue
 import subprocess
 import sys
+import threading
 import numpy as np
-# import onnx
-import onnxruntime as ort
-from typing import Generator, Any, Dict, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Tuple
 
-from utils import FFMPEG_PATH
+from utils import FFMPEG_PATH, LockedBarLogger, probe_media
 from proglog import default_bar_logger
+from session_pool import SESSION_POOL
+from timestamp_cache import get_cache
+from fingerprint import fingerprint_file
 
 SAMPLE_RATE = 32000
+DEFAULT_MEMORY_BUDGET_MB = 256
+MAX_MEMORY_SCORES = 16
+# Input lengths (seconds) allowed for blocks shorter than the block size
+BLOCK_BUCKETS = (5, 10, 20, 30, 60, 120, 300)
+# The model outputs 100 framewise scores per second of audio
+FRAMES_PER_SECOND = 100
+# When packing, files up to this share of a block are joined into shared
+# blocks, separated by this much silence so context doesn't leak between them
+PACK_MAX_SHARE = 0.5
+PACK_GUARD_SECONDS = 1
+# Bumped whenever the same scores would give different timestamps, so older
+# cached timestamps are rebuilt from the cached scores. 2: runs are joined
+# across block boundaries
+TIMESTAMPS_VERSION = 2
 
 is_windows = sys.platform.startswith('win')
 
@@ -32,67 +52,73 @@ def subsample(frame: np.ndarray, scale_factor: int) -> np.ndarray:
 
 def get_segments(
     scores: np.ndarray,
-    precision: int,
-    threshold: float,
-    offset: int
-) -> Generator[Any, Any, Any]:
-
-    seq_iter = iter(np.where(scores > threshold)[0])
-    try:
-        seq = next(seq_iter)
-        pred = scores[seq]
-        segment = {'start': seq, 'end': seq, 'pred': pred}
-    except StopIteration:
-        return
-
-    for seq in seq_iter:
-        pred = scores[seq]
-        if seq - 1 == segment['end']:
-            segment['end'] = seq
-            segment['pred'] = max(segment['pred'], pred)
-        else:
-            segment['start'] = segment['start']
-            segment['end'] = segment['end']
-
-            yield segment
-            segment = {'start': seq, 'end': seq, 'pred': pred}
-
-    yield segment
-
-
-def compute_timestamps(
-    framewise_output: np.ndarray,
-    precision: int,
-    threshold: float,
-    focus_idx: int,
-    offset: int,
-):
-    focus = framewise_output[:, focus_idx]
-    # precision in the amount of milliseconds per timestamp sample (higher values will result in less precise timestamps)
-
-    subsampled_scores = subsample(focus, precision)
-    segments = map(
-        lambda segment: {
-            'start': segment['start'] * precision / 100 + offset,
-            'end': segment['end'] * precision / 100 + offset + 1,
-            'pred': round(float(segment['pred']), 6)
-        }, get_segments(subsampled_scores, precision, threshold, offset))
-    return segments
-
-
-def pad_array_if_needed(arr, desired_size, pad_value=0):
-    current_size = arr.shape[0]
-    if current_size < desired_size:
-        padding_needed = desired_size - current_size
-        padded_array = np.pad(
-            arr, (0, padding_needed), "constant", constant_values=(pad_value,)
-        )
-        return padded_array
-    else:
-        return arr
-
-
-def load_audio(file: str, sr: int, frame_count: int):
+    threshold: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Runs of scores above threshold as (start indices, end indices, max score
+    # of each run), found from the edges of the mask instead of per hit
+    mask = np.concatenate(([False], scores > threshold, [False]))
+    edges = np.flatnonzero(mask[1:] != mask[:-1])
+    starts, ends = edges[::2], edges[1::2] - 1
+    if len(starts) == 0:
+        return starts, ends, scores[:0]
+
+    # Max over [start, end] of each run; the appended 0 keeps end + 1 in range
+    bounds = np.column_stack((starts, ends + 1)).ravel()
+    preds = np.maximum.reduceat(np.append(scores, 0), bounds)[::2]
+    return starts, ends, preds
+
+
+class SegmentBuilder:
+    """Turns one file's focus scores, fed block by block, into timestamps.
+
+    A run still open at the end of a block is carried over and joined with a
+    run at the start of the next block, so a sound crossing a block boundary
+    comes out as one clip instead of two.
+    """
+
+    def __init__(self, precision: int, threshold: float):
+        # precision in the amount of milliseconds per timestamp sample (higher values will result in less precise timestamps)
+        self.precision = precision
+        self.threshold = threshold
+        self.timestamps = []
+        self.open = None
+
+    def add_block(self, focus: np.ndarray, offset: int):
+        subsampled_scores = subsample(focus, self.precision)
+        starts, ends, preds = get_segments(subsampled_scores, self.threshold)
+
+        start_times = starts * self.precision / 100 + offset
+        end_times = ends * self.precision / 100 + offset + 1
+
+        segments = [
+            {'start': float(start), 'end': float(end), 'pred': float(pred)}
+            for start, end, pred in zip(start_times, end_times, preds)
+        ]
+
+        if self.open is not None:
+            if segments and starts[0] == 0:
+                self.open['end'] = segments[0]['end']
+                self.open['pred'] = max(self.open['pred'], segments[0]['pred'])
+                segments[0] = self.open
+            else:
+                self.timestamps.append(self.open)
+            self.open = None
+
+        # A run reaching the end of the block may continue in the next one
+        if segments and ends[-1] == len(subsampled_scores) - 1:
+            self.open = segments.pop()
+        self.timestamps.extend(segments)
+
+    def finish(self):
+        if self.open is not None:
+            self.timestamps.append(self.open)
+            self.open = None
+        for segment in self.timestamps:
+            segment['pred'] = round(segment['pred'], 6)
+        return self.timestamps
+
+
+def _open_audio_process(file: str, sr: int):
     cmd = [
         FFMPEG_PATH, '-hide_banner', '-loglevel', 'warning', '-i', file,
         '-filter_complex', '[0:a]aresample=32000:async=1,asetpts=PTS-STARTPTS,atempo=1,pan=mono|c0=c0[audio]', '-map',
@@ -109,23 +135,12 @@ def load_audio(file: str, sr: int, frame_count: int):
     if is_windows:
         subprocess_options['creationflags'] = subprocess.CREATE_NO_WINDOW
 
-    chunk_size = frame_count * 2
-
     process = subprocess.Popen(
         cmd, bufsize=1, **subprocess_options)
+    return process, cmd
 
-    try:
-        while True:
-            chunk = process.stdout.read(chunk_size)
-            if not chunk:
-                break
-            yield chunk
-    except GeneratorExit:
-        # Thrown if the user cancels the process (i.e. kills the thread)
-        process.terminate()
-        process.wait()
-        return
 
+def _finish_audio_process(process, cmd):
     process.stdout.close()
     return_code = process.wait()
     if return_code:
@@ -135,22 +150,251 @@ def load_audio(file: str, sr: int, frame_count: int):
         raise subprocess.CalledProcessError(return_code, cmd)
 
 
-def hash_file(file_path, algorithm='sha256', chunk_size=8192) -> str:
-    hash_obj = hashlib.new(algorithm)
-    
-    with open(file_path, 'rb') as f:
+def _read_into(stream, buffer: np.ndarray) -> int:
+    # Pipe reads can come back short, so keep filling until the block is full or EOF
+    view = memoryview(buffer).cast('B')
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled // buffer.itemsize
+
+
+def load_audio_into(file: str, sr: int, get_buffer):
+    # Decodes into caller-provided int16 buffers instead of allocating a new
+    # bytes object per block. Yields (buffer, n_samples); get_buffer returning
+    # None stops decoding early.
+    process, cmd = _open_audio_process(file, sr)
+
+    try:
         while True:
-            chunk = f.read(chunk_size)
-            if not chunk:
+            buffer = get_buffer()
+            if buffer is None:
+                process.terminate()
+                process.wait()
+                return
+            n_samples = _read_into(process.stdout, buffer)
+            if not n_samples:
                 break
-            hash_obj.update(chunk)
-    
-    return hash_obj.hexdigest()
+            yield buffer, n_samples
+    except GeneratorExit:
+        # Thrown if the user cancels the process (i.e. kills the thread)
+        process.terminate()
+        process.wait()
+        return
 
-timestamps_dict: Dict[Tuple[str, int, int, float, str], Dict[str, Any]] = {}
+    _finish_audio_process(process, cmd)
+
+
+def blocks_for_memory_budget(frame_count: int, memory_budget_mb: int, batch_size: int = 1) -> int:
+    # A float32 batch at the full block length is always held for inference,
+    # plus at most one at a shorter bucket length (see BlockBatcher); the rest
+    # of the budget goes to int16 decode buffers, with at least one decoding
+    # and one being consumed
+    shorter = [length for length in bucket_lengths() if length < frame_count]
+    batch_samples = frame_count + max(shorter, default=0)
+    budget = memory_budget_mb * 1024 * 1024 - batch_size * batch_samples * 4
+    return max(2, budget // (frame_count * 2))
+
+
+_END_OF_STREAM = object()
+
+
+def stream_audio(file: str, sr: int, frame_count: int, n_buffers: int = 2):
+    # Decode on a background thread so inference can start on the first block
+    # while ffmpeg is still decoding the rest. Only n_buffers preallocated int16
+    # blocks ever exist; each yielded (buffer, n_samples) is recycled once the
+    # consumer asks for the next block.
+    free = queue.Queue()
+    for _ in range(max(2, n_buffers)):
+        free.put(np.empty(frame_count, dtype=np.int16))
+    filled = queue.Queue()
+    stop = threading.Event()
+
+    def get_buffer():
+        while not stop.is_set():
+            try:
+                return free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def decode():
+        try:
+            for item in load_audio_into(file, sr, get_buffer):
+                filled.put(item)
+            filled.put(_END_OF_STREAM)
+        except Exception as e:
+            filled.put(e)
+
+    thread = threading.Thread(target=decode, daemon=True)
+    thread.start()
 
-def get_timestamps(file, precision=100, block_size=600, threshold=0.90, focus_idx=58, model="bdetectionmodel_05_01_23", logger=None):
-    # Input checking
+    try:
+        while True:
+            item = filled.get()
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            free.put(item[0])
+    finally:
+        # Also reached if the consumer is cancelled; get_buffer then stops ffmpeg
+        stop.set()
+
+
+def estimate_block_count(file: str, block_size: int, duration=None):
+    if duration is None:
+        duration = probe_media(file)['duration']
+    if duration is None:
+        return None
+    return max(1, math.ceil(duration / block_size))
+
+
+def bucket_lengths():
+    return [seconds * SAMPLE_RATE for seconds in BLOCK_BUCKETS]
+
+
+def bucket_length(n_samples: int, frame_count: int) -> int:
+    # Shortest allowed input length that fits n_samples. Only a few lengths
+    # are used so blocks of similar length can still share a batch
+    for length in bucket_lengths():
+        if length >= frame_count:
+            break
+        if length >= n_samples:
+            return length
+    return frame_count
+
+
+class BlockBatcher:
+    """Stacks audio blocks (from one or several files) into a single
+    (batch_size, length) input and runs the model once per full batch.
+
+    Full blocks use the whole frame_count; shorter ones (the end of a file,
+    or a short file) are padded only up to bucket_length() and the scores of
+    the padding are dropped. Blocks of a different length than the pending
+    ones flush the batch first. Each block is registered with a callback that
+    receives its framewise output; callbacks run in the order blocks were added.
+
+    The full-length input buffer is reused for the batcher's whole lifetime,
+    but a shorter bucket's is freed once its batch has run, so at most one of
+    those exists at a time (which blocks_for_memory_budget accounts for).
+    """
+
+    def __init__(self, session, frame_count: int, batch_size: int = 1):
+        if batch_size < 1:
+            raise Exception("Batch size must be at least 1!")
+
+        self.session = session
+        self.frame_count = frame_count
+        self.batch_size = batch_size
+        # Input buffers by bucket length, allocated when first needed
+        self.batches = {}
+        self.length = frame_count
+        self.pending = []
+
+    def add(self, samples: np.ndarray, n_samples: int, on_result):
+        length = bucket_length(n_samples, self.frame_count)
+        if self.pending and length != self.length:
+            self.flush()
+        self.length = length
+
+        batch = self.batches.get(length)
+        if batch is None:
+            batch = self.batches[length] = np.zeros(
+                (self.batch_size, length), dtype=np.float32)
+
+        row = batch[len(self.pending)]
+        np.multiply(samples[:n_samples], 1 / (2**15),
+                    out=row[:n_samples], dtype=np.float32)
+        row[n_samples:] = 0
+
+        self.pending.append((on_result, n_samples))
+        if len(self.pending) == self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        ort_inputs = {"input": self.batches[self.length][:len(self.pending)]}
+        framewise_output = self.session.run(["output"], ort_inputs)[0]
+        if self.length != self.frame_count:
+            del self.batches[self.length]
+
+        pending, self.pending = self.pending, []
+        for preds, (on_result, n_samples) in zip(framewise_output, pending):
+            # Keep only the frames covering real audio
+            valid = math.ceil(len(preds) * n_samples / self.length)
+            on_result(preds[:valid])
+
+
+class BlockPacker:
+    """Joins the audio of short files into shared blocks for a BlockBatcher.
+
+    Files are added whole and placed one after another, with
+    PACK_GUARD_SECONDS of silence between them, until the next one doesn't
+    fit; the block then goes to the batcher and each file's callback gets
+    only the framewise output covering its own audio. Every file starts on a
+    frame boundary, so its frames line up with running it on its own.
+    """
+
+    def __init__(self, batcher: BlockBatcher, frame_count: int):
+        self.batcher = batcher
+        self.frame_count = frame_count
+        self.guard = PACK_GUARD_SECONDS * SAMPLE_RATE
+        self.hop = SAMPLE_RATE // FRAMES_PER_SECOND
+        self.buffer = np.zeros(frame_count, dtype=np.int16)
+        self.position = 0
+        self.entries = []
+
+    def fits(self, duration: float) -> bool:
+        return duration * SAMPLE_RATE + self.guard <= self.frame_count * PACK_MAX_SHARE
+
+    def add(self, audio: np.ndarray, on_result) -> int:
+        # Returns how many times on_result will be called
+        n_samples = len(audio)
+        if n_samples > self.frame_count:
+            # Longer than the container said; infer it on its own instead
+            starts = range(0, n_samples, self.frame_count)
+            for start in starts:
+                block = audio[start:start + self.frame_count]
+                self.batcher.add(block, len(block), on_result)
+            return len(starts)
+
+        if self.position + n_samples > self.frame_count:
+            self.flush()
+
+        end = self.position + n_samples
+        self.buffer[self.position:end] = audio
+        self.entries.append((self.position, n_samples, on_result))
+        # Round the next start up to a whole frame
+        self.position = -(-(end + self.guard) // self.hop) * self.hop
+        self.buffer[end:self.position] = 0
+        return 1
+
+    def flush(self):
+        if not self.entries:
+            return
+
+        entries, self.entries = self.entries, []
+        last_start, last_samples, _ = entries[-1]
+        self.position = 0
+
+        def split(preds):
+            for start, n_samples, on_result in entries:
+                first = start // self.hop
+                count = math.ceil(n_samples / self.hop) + 1
+                on_result(preds[first:first + count])
+
+        # The batcher copies the samples, so the buffer can be refilled right away
+        self.batcher.add(self.buffer, last_start + last_samples, split)
+
+
+def _check_parameters(precision, block_size, threshold):
     if precision < 0:
         raise Exception("Precision must be a positive number!")
 
@@ -160,59 +404,283 @@ def get_timestamps(file, precision=100, block_size=600, threshold=0.90, focus_id
     if block_size < 0:
         raise Exception("Block size must be a positive number!")
 
-    file_hash = hash_file(file)
-    if (file_hash, precision, block_size, threshold, model) in timestamps_dict:
-        previous_data = timestamps_dict[(file_hash, precision, block_size, threshold, model)]
-        previous_data['filename'] = file
-        
-        # Simulate the progress bar increment
-        if logger:
-            bar_logger = default_bar_logger(logger)
-            block_count = len(list(load_audio(file, SAMPLE_RATE, SAMPLE_RATE * block_size)))
-            for _ in bar_logger.iter_bar(block=range(block_count)):
-                pass
-        
-        return previous_data, True
 
-    sess_options = ort.SessionOptions()
-    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+timestamps_dict: Dict[Tuple[str, int, int, float, str], Dict[str, Any]] = {}
 
-    ort_session = ort.InferenceSession(
-        model,
-        sess_options,
-        providers=ort.get_available_providers()
-    )
 
-    offset = 0
+def clear_cached_timestamps():
+    timestamps_dict.clear()
+    with _scores_lock:
+        scores_dict.clear()
+    cache = get_cache()
+    if cache:
+        cache.clear()
+
+
+def timestamps_from_scores(block_scores, precision, threshold, block_size):
+    builder = SegmentBuilder(precision, threshold)
+    for i, focus in enumerate(block_scores):
+        builder.add_block(focus, i * block_size)
+    return builder.finish()
+
+
+# Framewise focus-class scores of recently analyzed files, keyed by (file_hash, block_size, focus_idx, model)
+scores_dict: 'OrderedDict[Tuple[str, int, int, str], list]' = OrderedDict()
+_scores_lock = threading.Lock()
+
+
+def _get_cached_scores(key):
+    with _scores_lock:
+        if key in scores_dict:
+            scores_dict.move_to_end(key)
+            return scores_dict[key]
+
+    cache = get_cache()
+    block_scores = cache.get_scores(key) if cache else None
+    if block_scores is not None:
+        _remember_scores(key, block_scores, persist=False)
+    return block_scores
+
+
+def _remember_scores(key, block_scores, persist=True):
+    with _scores_lock:
+        scores_dict[key] = block_scores
+        while len(scores_dict) > MAX_MEMORY_SCORES:
+            scores_dict.popitem(last=False)
+
+    cache = get_cache()
+    if persist and cache:
+        cache.put_scores(key, block_scores)
+
+
+def _store_timestamps(key, info):
+    timestamps_dict[key] = info
+    cache = get_cache()
+    if cache:
+        cache.put(key, info)
+
+
+def _get_cached_timestamps(file, file_hash, precision, block_size, threshold, focus_idx, model, logger, bar_prefix=''):
+    key = (file_hash, precision, block_size, threshold, model)
+    if key not in timestamps_dict:
+        cache = get_cache()
+        stored = cache.get(key) if cache else None
+        if stored is not None and stored.get('version') != TIMESTAMPS_VERSION:
+            stored = None
+        if stored is None:
+            # Timestamps for these settings were never stored, but they can
+            # still be rebuilt from the model's scores without running inference
+            block_scores = _get_cached_scores(
+                (file_hash, block_size, focus_idx, model))
+            if block_scores is None:
+                return None
+            stored = {'timestamps': timestamps_from_scores(
+                block_scores, precision, threshold, block_size),
+                'block_count': len(block_scores),
+                'version': TIMESTAMPS_VERSION}
+            if cache:
+                cache.put(key, stored)
+        timestamps_dict[key] = stored
+
+    previous_data = timestamps_dict[key]
+    previous_data['filename'] = file
+
+    # Simulate the progress bar increment. Older entries have no block count,
+    # so fall back to the container duration instead of decoding the audio again
+    if logger:
+        bar_logger = default_bar_logger(logger)
+        block_count = previous_data.get('block_count')
+        if block_count is None:
+            block_count = estimate_block_count(file, block_size) or 1
+        for _ in bar_logger.iter_bar(bar_prefix=bar_prefix, block=range(block_count)):
+            pass
 
-    blocks = list(load_audio(file, SAMPLE_RATE, SAMPLE_RATE * block_size))
+    return previous_data
 
-    info = {'filename': file, 'timestamps': []}
 
+def _feed_blocks(file, block_size, batcher, n_buffers, logger, on_result, bar_prefix='', cancel_event=None, packer=None):
+    # Queues the file's blocks; on_result gets each block's framewise output
+    # once its batch has run. Returns how many results to expect
     frame_count = SAMPLE_RATE * block_size
 
+    blocks = stream_audio(file, SAMPLE_RATE, frame_count, n_buffers)
+
+    duration = probe_media(file)['duration'] if logger or packer else None
     if logger:
         bar_logger = default_bar_logger(logger)
-        blocks = bar_logger.iter_bar(block=blocks)
+        block_count = estimate_block_count(file, block_size, duration)
+        if block_count:
+            bar_logger(**{bar_prefix + 'block__total': block_count})
+            blocks = bar_logger.iter_bar(bar_prefix=bar_prefix, block=blocks)
+
+    # Short files are decoded whole and handed to the packer
+    pack = packer is not None and duration is not None and packer.fits(duration)
+    pieces = []
+    block_count = 0
+
+    for samples, n_samples in blocks:
+        if cancel_event is not None and cancel_event.is_set():
+            raise Exception("Detection cancelled.")
+        if pack:
+            pieces.append(samples[:n_samples].copy())
+        else:
+            batcher.add(samples, n_samples, on_result)
+            block_count += 1
+
+    if pieces:
+        block_count += packer.add(np.concatenate(pieces), on_result)
+
+    return block_count
+
+
+def get_timestamps_multi(files, precision=100, block_size=600, threshold=0.90, focus_idx=58, model="bdetectionmodel_05_01_23", logger=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, batch_size=1, session_options=None, bar_prefix='', cancel_event=None, pack=False, worker=0, on_result=None):
+    # Blocks from consecutive files share batches, so a partial batch at the
+    # end of one file is filled with the start of the next. With pack, short
+    # files also share blocks (see BlockPacker)
+    # Each file is stored as soon as its last block has run, and
+    # on_result(index, result) is called in input order as files finish.
+    _check_parameters(precision, block_size, threshold)
+
+    results = [None] * len(files)
+    reported = 0
+
+    def report_finished():
+        nonlocal reported
+        while reported < len(files) and results[reported] is not None:
+            if on_result:
+                on_result(reported, results[reported])
+            reported += 1
+
+    uncached = []
+    for i, file in enumerate(files):
+        file_hash = fingerprint_file(file)
+        previous_data = _get_cached_timestamps(
+            file, file_hash, precision, block_size, threshold, focus_idx, model, logger, bar_prefix)
+        if previous_data is not None:
+            results[i] = (previous_data, True)
+        else:
+            uncached.append((i, file, file_hash))
+    report_finished()
 
-    for block in blocks:
-        samples = np.frombuffer(block, dtype=np.int16)
-        samples = pad_array_if_needed(samples, frame_count)
-        samples = samples.reshape(1, -1)
-        samples = samples / (2**15)
-        samples = samples.astype(np.float32)
+    if not uncached:
+        return results
 
-        ort_inputs = {"input": samples}
-        framewise_output = ort_session.run(["output"], ort_inputs)[0]
+    frame_count = SAMPLE_RATE * block_size
+    batcher = BlockBatcher(SESSION_POOL.get(model, options=session_options, worker=worker),
+                           frame_count, batch_size)
+    n_buffers = blocks_for_memory_budget(frame_count, memory_budget_mb, batch_size)
+    packer = BlockPacker(batcher, frame_count) if pack else None
+
+    def finish(i, file, file_hash, block_scores):
+        _remember_scores((file_hash, block_size, focus_idx, model), block_scores)
+
+        info = {'filename': file, 'timestamps': timestamps_from_scores(
+            block_scores, precision, threshold, block_size),
+            'block_count': len(block_scores),
+            'version': TIMESTAMPS_VERSION}
+        _store_timestamps((file_hash, precision, block_size, threshold, model), info)
+        results[i] = (info, False)
+        report_finished()
+
+    def feed(i, file, file_hash):
+        block_scores = []
+        expected = None
+
+        def collect(preds):
+            block_scores.append(preds[:, focus_idx].copy())
+            if len(block_scores) == expected:
+                finish(i, file, file_hash, block_scores)
+
+        expected = _feed_blocks(file, block_size, batcher, n_buffers, logger, collect,
+                                bar_prefix, cancel_event, packer)
+        # Every block may already have run with the file's last full batch
+        if len(block_scores) == expected:
+            finish(i, file, file_hash, block_scores)
 
-        preds = framewise_output[0]
-        info["timestamps"].extend(
-            compute_timestamps(
-                preds, precision, threshold, focus_idx, offset
-            )
-        )
+    try:
+        for i, file, file_hash in uncached:
+            feed(i, file, file_hash)
+    except Exception:
+        # Still store the files that were fed in full before this one failed
+        if cancel_event is None or not cancel_event.is_set():
+            try:
+                if packer:
+                    packer.flush()
+                batcher.flush()
+            except Exception:
+                pass
+        raise
 
-        offset += block_size
+    if packer:
+        packer.flush()
+    batcher.flush()
 
-    timestamps_dict[(file_hash, precision, block_size, threshold, model)] = info
-    return info, False
+    return results
+
+
+def get_timestamps(file, precision=100, block_size=600, threshold=0.90, focus_idx=58, model="bdetectionmodel_05_01_23", logger=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, batch_size=1):
+    return get_timestamps_multi([file], precision, block_size, threshold, focus_idx, model, logger, memory_budget_mb, batch_size)[0]
+
+
+def get_timestamps_parallel(files, precision=100, block_size=600, threshold=0.90, focus_idx=58, model="bdetectionmodel_05_01_23", logger=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, batch_size=1, workers=1, on_result=None, pack=False):
+    # Runs detection for several files at once. ONNX Runtime releases the GIL
+    # and decoding happens in ffmpeg, so threads are enough to keep every core
+    # busy. Each worker runs its own session, and intra-op threads (unless
+    # the user set a count, see ort_tuning) and the memory budget are split
+    # between workers.
+    # on_result(index, result) is called in input order as files finish.
+    # Each worker takes a share of the files in one get_timestamps_multi call,
+    # so blocks from different files fill its batches (and with pack, its
+    # short files share blocks).
+    workers = max(1, min(workers, len(files)))
+    if workers == 1:
+        return get_timestamps_multi(files, precision, block_size, threshold, focus_idx, model,
+                                    logger, memory_budget_mb, batch_size, pack=pack, on_result=on_result)
+
+    _check_parameters(precision, block_size, threshold)
+
+    session_options = {
+        'intra_op_num_threads': max(1, (os.cpu_count() or 1) // workers),
+    } if workers > 1 else None
+    worker_memory_budget_mb = max(1, memory_budget_mb // workers)
+    bar_logger = LockedBarLogger(logger) if logger and workers > 1 else logger
+    cancel_event = threading.Event()
+
+    groups = [list(range(n, len(files), workers)) for n in range(workers)]
+    # Workers hand each finished file over as (index, result)
+    finished = queue.Queue()
+
+    def detect(n, group):
+        def hand_over(k, result):
+            finished.put((group[k], result))
+
+        get_timestamps_multi(
+            [files[i] for i in group], precision, block_size, threshold, focus_idx, model, bar_logger,
+            worker_memory_budget_mb, batch_size, session_options=session_options,
+            bar_prefix=f"{n}_", cancel_event=cancel_event, pack=pack, worker=n, on_result=hand_over)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(detect, n, group) for n, group in enumerate(groups)]
+        results = [None] * len(files)
+        reported = 0
+        while reported < len(files):
+            try:
+                i, result = finished.get(timeout=0.1)
+            except queue.Empty:
+                # A worker queues all of its results before it finishes, so
+                # only a failed one can leave us waiting here
+                for future in futures:
+                    if future.done():
+                        future.result()
+                continue
+            results[i] = result
+            while reported < len(files) and results[reported] is not None:
+                if on_result:
+                    on_result(reported, results[reported])
+                reported += 1
+        return results
+    finally:
+        # Stops the remaining workers if a file fails or the calling thread is killed
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# The app is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from timestamp_cache import configure_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def app_data_dir(tmp_path, monkeypatch):
+    # Keeps caches and machine settings written by the code under test out of the real app data dir
+    monkeypatch.setenv('AUTOCOMPER_HOME', str(tmp_path / 'home'))
+    configure_cache()
+    yield tmp_path / 'home'
+    configure_cache()
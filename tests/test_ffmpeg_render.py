@@ -0,0 +1,89 @@
+import pytest
+
+from ffmpeg_render import build_render_args, chunk_sources, plan_fast_cut
+
+
+def test_build_render_args_cuts_every_range_and_joins_them():
+    sources = [('a.mp4', [(1.0, 3.0), (10.0, 10.5)]), ('b.mp4', [(0.0, 4.0)])]
+    args, filter_graph, duration = build_render_args(sources, 'out.mp4')
+
+    assert args[:15] == ['-ss', '1.000', '-t', '2.000', '-i', 'a.mp4',
+                         '-ss', '10.000', '-t', '0.500', '-i', 'a.mp4',
+                         '-ss', '0.000', '-t']
+    assert args[16:18] == ['-i', 'b.mp4']
+    assert duration == pytest.approx(6.5)
+    assert '[v0][a0][v1][a1][v2][a2]concat=n=3:v=1:a=1[vout][aout]' in filter_graph
+    assert args[-1] == 'out.mp4'
+    assert '-movflags' in args
+
+
+def test_build_render_args_for_audio():
+    args, filter_graph, _ = build_render_args([('a.mp3', [(1.0, 2.0)])], 'out.mp3', is_video=False)
+    assert '[v0]' not in filter_graph
+    assert 'concat=n=1:v=0:a=1[aout]' in filter_graph
+    assert args[args.index('-map') + 1] == '[aout]'
+    assert '-movflags' not in args
+
+
+def test_build_render_args_adds_silence_for_sources_without_audio():
+    _, filter_graph, _ = build_render_args([('a.mp4', [(1.0, 2.5)])], 'out.mp4', has_audio=[False])
+    assert 'aevalsrc=0:s=44100:c=stereo:d=1.500[a0]' in filter_graph
+
+    with pytest.raises(Exception):
+        build_render_args([('a.mp4', [(1.0, None)])], 'out.mp4', has_audio=[False])
+
+
+def test_build_render_args_normalizes_each_source_on_its_own():
+    sources = [('a.mp4', [(1.0, 2.0)]), ('b.mp4', [(0.0, 1.0)])]
+    _, filter_graph, _ = build_render_args(sources, 'out.mp4', normalize=True)
+    assert filter_graph.count('loudnorm') == 2
+    assert '[vs0][an0][vs1][an1]concat=n=2:v=1:a=1[vout][aout]' in filter_graph
+
+
+def test_build_render_args_normalizes_with_measured_gains():
+    sources = [('a.mp4', [(1.0, 2.0)]), ('b.mp4', [(0.0, 1.0)])]
+    _, filter_graph, _ = build_render_args(sources, 'out.mp4', normalize=True, gains=[-3.5, 2.0])
+    assert 'loudnorm' not in filter_graph
+    assert '[as0]volume=-3.50dB,' in filter_graph
+    assert '[as1]volume=2.00dB,' in filter_graph
+
+
+def test_build_render_args_resizes_and_sets_the_container():
+    args, filter_graph, _ = build_render_args(
+        [('a.mp4', [(1.0, 2.0)])], 'piece.ts', size=(1280, 720), output_format='mpegts')
+    assert 'scale=1280:720:force_original_aspect_ratio=decrease' in filter_graph
+    assert args[-3:] == ['-f', 'mpegts', 'piece.ts']
+    assert '-movflags' not in args
+
+
+def test_build_render_args_without_clips():
+    with pytest.raises(Exception):
+        build_render_args([('a.mp4', [])], 'out.mp4')
+
+
+def test_chunk_sources_splits_ranges_in_order():
+    sources = [('a.mp4', [(i, i + 1) for i in range(12)]), ('b.mp4', [(0, 1)]),
+               ('c.mp4', [(i, i + 1) for i in range(12)])]
+    chunks = chunk_sources(sources, max_clips=10)
+
+    assert [sum(len(segments) for _, segments in chunk) for chunk, _ in chunks] == [10, 10, 5]
+    assert chunks[1][0] == [('a.mp4', [(10, 11), (11, 12)]), ('b.mp4', [(0, 1)]),
+                            ('c.mp4', [(i, i + 1) for i in range(7)])]
+    assert chunks[1][1] == [0, 1, 2]
+    flattened = [(filename, segment) for chunk, _ in chunks for filename, segments in chunk
+                 for segment in segments]
+    assert flattened == [(filename, segment) for filename, segments in sources for segment in segments]
+
+
+def test_plan_fast_cut_copies_whole_gops_only():
+    keyframes = [0.0, 2.0, 4.0, 6.0, 8.0]
+    assert plan_fast_cut([(1.0, 7.0)], keyframes) == [
+        (1.0, 2.0, False), (2.0, 6.0, True), (6.0, 7.0, False)]
+
+
+def test_plan_fast_cut_re_encodes_ranges_without_a_whole_gop():
+    assert plan_fast_cut([(2.5, 5.0)], [0.0, 2.0, 4.0, 6.0]) == [(2.5, 5.0, False)]
+
+
+def test_plan_fast_cut_drops_pieces_shorter_than_min_length():
+    assert plan_fast_cut([(1.99, 6.0)], [0.0, 2.0, 4.0, 6.0], min_length=0.04) == [(2.0, 6.0, True)]
@@ -0,0 +1,31 @@
+import os
+import shutil
+
+from fingerprint import SAMPLE_CHUNK_SIZE, fingerprint_file
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_strategies_are_prefixed_except_sha256(tmp_path):
+    path = write(tmp_path / 'a.bin', b'abc')
+    assert fingerprint_file(path, 'sampled').startswith('sampled:')
+    assert fingerprint_file(path, 'full').startswith('full:')
+    assert len(fingerprint_file(path, 'sha256')) == 64
+
+
+def test_copies_share_a_fingerprint(tmp_path):
+    path = write(tmp_path / 'a.bin', os.urandom(4 * SAMPLE_CHUNK_SIZE))
+    copy = str(tmp_path / 'b.bin')
+    shutil.copy(path, copy)
+    assert fingerprint_file(path) == fingerprint_file(copy)
+
+
+def test_changed_files_get_a_new_fingerprint(tmp_path):
+    path = write(tmp_path / 'a.bin', b'abc')
+    before = fingerprint_file(path, 'full')
+    write(path, b'abcd')
+    assert fingerprint_file(path, 'full') != before
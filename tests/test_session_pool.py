@@ -0,0 +1,59 @@
+import onnxruntime as ort
+
+import session_pool
+from ort_tuning import configure_tuning
+from session_pool import SessionPool
+
+
+class FakeInferenceSession:
+    def __init__(self, path, options, providers):
+        self.path = path
+        self.options = options
+        self.providers = providers
+
+
+def fake_settings(model):
+    # A tuned profile that sets the same option the caller overrides
+    return model, ['CPUExecutionProvider'], {'intra_op_num_threads': 4, 'enable_cpu_mem_arena': False}
+
+
+def test_explicit_options_win_over_the_tuned_profile(monkeypatch):
+    monkeypatch.setattr(session_pool, 'session_settings', fake_settings)
+    monkeypatch.setattr(ort, 'InferenceSession', FakeInferenceSession)
+    session = SessionPool().get('model.onnx', options={'intra_op_num_threads': 1})
+    assert session.options.intra_op_num_threads == 1
+    assert session.options.enable_cpu_mem_arena is False
+    assert session.providers == ['CPUExecutionProvider']
+
+
+def test_configured_threads_win_over_the_callers_split(monkeypatch):
+    monkeypatch.setattr(session_pool, 'session_settings', fake_settings)
+    monkeypatch.setattr(ort, 'InferenceSession', FakeInferenceSession)
+    configure_tuning(threads=3)
+    try:
+        session = SessionPool().get('model.onnx', options={'intra_op_num_threads': 1})
+    finally:
+        configure_tuning()
+    assert session.options.intra_op_num_threads == 3
+
+
+def test_workers_get_their_own_sessions(monkeypatch):
+    monkeypatch.setattr(session_pool, 'session_settings', fake_settings)
+    monkeypatch.setattr(ort, 'InferenceSession', FakeInferenceSession)
+    pool = SessionPool(max_sessions=1)
+    sessions = [pool.get('model.onnx', worker=n) for n in range(3)]
+    assert len({id(session) for session in sessions}) == 3
+    assert pool.get('model.onnx', worker=1) is sessions[1]
+
+
+def test_stats_count_loads_and_reuse(monkeypatch):
+    monkeypatch.setattr(session_pool, 'session_settings', fake_settings)
+    monkeypatch.setattr(ort, 'InferenceSession', FakeInferenceSession)
+    pool = SessionPool()
+    pool.get('model.onnx')
+    pool.get('model.onnx')
+    pool.get('model.onnx', worker=1)
+    stats = pool.get_stats()
+    assert stats['loads'] == 2
+    assert stats['load_time_total'] >= 0
+    assert [(s['worker'], s['hits']) for s in stats['sessions']] == [(0, 1), (1, 0)]
@@ -0,0 +1,223 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import sound_reader
+from sound_reader import (FRAMES_PER_SECOND, SAMPLE_RATE, BlockBatcher, BlockPacker, SegmentBuilder,
+                          bucket_length, get_segments, get_timestamps_multi, get_timestamps_parallel,
+                          timestamps_from_scores)
+
+HOP = SAMPLE_RATE // FRAMES_PER_SECOND
+
+
+class FakeSession:
+    # Stands in for the model: frame j scores the mean loudness of samples
+    # [j * HOP, (j + 1) * HOP) in class 0, plus one trailing frame like the real model
+    def __init__(self):
+        self.input_shapes = []
+
+    def run(self, names, inputs):
+        audio = inputs['input']
+        self.input_shapes.append(audio.shape)
+        n_frames = audio.shape[1] // HOP + 1
+        padded = np.zeros((audio.shape[0], n_frames * HOP), dtype=np.float32)
+        padded[:, :audio.shape[1]] = audio
+        loudness = np.abs(padded).reshape(audio.shape[0], n_frames, HOP).mean(axis=2)
+        return [np.stack((loudness, 1 - loudness), axis=2)]
+
+
+def burst_audio(n_samples, bursts):
+    # int16 audio that is silent except for loud (start, end) second ranges
+    audio = np.zeros(n_samples, dtype=np.int16)
+    for start, end in bursts:
+        audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] = 20000
+    return audio
+
+
+def test_get_segments_finds_runs_and_their_peaks():
+    scores = np.array([0.1, 0.95, 0.97, 0.2, 0.92, 0.3, 0.99])
+    starts, ends, preds = get_segments(scores, 0.9)
+    assert starts.tolist() == [1, 4, 6]
+    assert ends.tolist() == [2, 4, 6]
+    assert preds.tolist() == pytest.approx([0.97, 0.92, 0.99])
+
+
+def test_get_segments_without_hits():
+    starts, ends, preds = get_segments(np.array([0.1, 0.2]), 0.9)
+    assert len(starts) == len(ends) == len(preds) == 0
+
+
+def test_segment_builder_joins_runs_across_blocks():
+    # 3 s blocks at precision 100 (one subsample per second)
+    builder = SegmentBuilder(100, 0.9)
+    builder.add_block(np.repeat([0.0, 0.0, 0.95], 100), 0)
+    builder.add_block(np.repeat([0.97, 0.0, 0.0], 100), 3)
+    assert builder.finish() == [{'start': 2.0, 'end': 4.0, 'pred': 0.97}]
+
+
+def test_segment_builder_keeps_runs_apart_when_the_next_block_starts_quiet():
+    builder = SegmentBuilder(100, 0.9)
+    builder.add_block(np.repeat([0.0, 0.0, 0.95], 100), 0)
+    builder.add_block(np.repeat([0.0, 0.97, 0.0], 100), 3)
+    assert builder.finish() == [{'start': 2.0, 'end': 3.0, 'pred': 0.95},
+                                {'start': 4.0, 'end': 5.0, 'pred': 0.97}]
+
+
+def test_timestamps_do_not_depend_on_block_boundaries():
+    rng = np.random.default_rng(1)
+    scores = (rng.random(3000) > 0.7).astype(np.float32)
+    whole = timestamps_from_scores([scores], 10, 0.5, 30)
+    blocks = timestamps_from_scores(np.split(scores, 10), 10, 0.5, 3)
+    assert blocks == whole
+
+
+def test_bucket_length_picks_the_shortest_fitting_bucket():
+    frame_count = 60 * SAMPLE_RATE
+    assert bucket_length(3 * SAMPLE_RATE, frame_count) == 5 * SAMPLE_RATE
+    assert bucket_length(25 * SAMPLE_RATE, frame_count) == 30 * SAMPLE_RATE
+    assert bucket_length(59 * SAMPLE_RATE, frame_count) == frame_count
+
+
+def test_block_batcher_matches_running_each_block_alone():
+    frame_count = 10 * SAMPLE_RATE
+    rng = np.random.default_rng(2)
+    lengths = [frame_count, frame_count, 3 * SAMPLE_RATE, frame_count, 7 * SAMPLE_RATE + 640]
+    blocks = [rng.integers(-2**15, 2**15, n, dtype=np.int16) for n in lengths]
+
+    session = FakeSession()
+    batcher = BlockBatcher(session, frame_count, batch_size=2)
+    results = []
+    for block in blocks:
+        batcher.add(block, len(block), results.append)
+    batcher.flush()
+
+    assert len(results) == len(blocks)
+    for block, preds in zip(blocks, results):
+        alone = FakeSession().run(["output"], {"input": block[np.newaxis, :] / 2**15})[0][0]
+        np.testing.assert_allclose(preds, alone, atol=1e-6)
+    # The two full blocks share a batch; the short ones run at their bucket length
+    assert session.input_shapes[0] == (2, frame_count)
+    assert (1, 5 * SAMPLE_RATE) in session.input_shapes
+
+
+def test_block_batcher_frees_shorter_bucket_buffers():
+    frame_count = 60 * SAMPLE_RATE
+    batcher = BlockBatcher(FakeSession(), frame_count, batch_size=2)
+    batcher.add(np.zeros(frame_count, dtype=np.int16), frame_count, lambda preds: None)
+    batcher.add(np.zeros(SAMPLE_RATE, dtype=np.int16), SAMPLE_RATE, lambda preds: None)
+    batcher.flush()
+    assert list(batcher.batches) == [frame_count]
+
+
+def detect(files, frame_count, pack):
+    # Scores of each file's focus class, run through a batcher (and packer)
+    # the same way get_timestamps_multi does
+    batcher = BlockBatcher(FakeSession(), frame_count, batch_size=2)
+    packer = BlockPacker(batcher, frame_count) if pack else None
+    all_scores = []
+    for audio in files:
+        scores = []
+        all_scores.append(scores)
+
+        def collect(preds, scores=scores):
+            scores.append(preds[:, 0].copy())
+
+        if packer:
+            packer.add(audio, collect)
+        else:
+            for start in range(0, len(audio), frame_count):
+                block = audio[start:start + frame_count]
+                batcher.add(block, len(block), collect)
+    if packer:
+        packer.flush()
+    batcher.flush()
+    return all_scores
+
+
+def test_block_packer_shares_blocks_and_keeps_timestamps():
+    block_size = 60
+    frame_count = block_size * SAMPLE_RATE
+    files = [burst_audio(10 * SAMPLE_RATE, [(2, 5)]),
+             burst_audio(8 * SAMPLE_RATE, [(1, 1.5), (6, 8)]),
+             burst_audio(12 * SAMPLE_RATE, [])]
+
+    packed = detect(files, frame_count, pack=True)
+    unpacked = detect(files, frame_count, pack=False)
+
+    for packed_scores, unpacked_scores in zip(packed, unpacked):
+        assert len(packed_scores) == 1
+        assert timestamps_from_scores(packed_scores, 1, 0.5, block_size) == \
+            timestamps_from_scores(unpacked_scores, 1, 0.5, block_size)
+    assert timestamps_from_scores(packed[0], 100, 0.5, block_size) == \
+        [{'start': 2.0, 'end': 5.0, 'pred': pytest.approx(20000 / 2**15)}]
+
+
+def test_block_packer_fits_files_up_to_its_share_of_a_block():
+    packer = BlockPacker(BlockBatcher(FakeSession(), 60 * SAMPLE_RATE), 60 * SAMPLE_RATE)
+    assert packer.fits(20)
+    assert not packer.fits(30)
+    assert math.isclose(packer.guard / SAMPLE_RATE, 1)
+
+
+def test_block_packer_keeps_frames_aligned_for_any_file_length():
+    # 798976 samples isn't a whole number of hops, so the next file would
+    # start partway into a frame unless its position is rounded up
+    block_size = 60
+    frame_count = block_size * SAMPLE_RATE
+    files = [burst_audio(798976, [(20, 24.5)]), burst_audio(10 * SAMPLE_RATE + 77, [(2, 5)]),
+             burst_audio(3 * SAMPLE_RATE + 5, [(0.5, 1.25)])]
+
+    packed = detect(files, frame_count, pack=True)
+    unpacked = detect(files, frame_count, pack=False)
+
+    for packed_scores, unpacked_scores in zip(packed, unpacked):
+        assert timestamps_from_scores(packed_scores, 1, 0.5, block_size) == \
+            timestamps_from_scores(unpacked_scores, 1, 0.5, block_size)
+
+
+def fake_detection(monkeypatch, audio_by_file):
+    # Runs detection on in-memory audio; a file mapped to None fails to decode
+    session = FakeSession()
+
+    def stream_audio(file, sr, frame_count, n_buffers=2):
+        audio = audio_by_file[file]
+        if audio is None:
+            raise Exception("Couldn't decode " + file)
+        for start in range(0, len(audio), frame_count):
+            block = audio[start:start + frame_count]
+            yield block, len(block)
+
+    monkeypatch.setattr(sound_reader, 'stream_audio', stream_audio)
+    monkeypatch.setattr(sound_reader, 'fingerprint_file', lambda file: file)
+    monkeypatch.setattr(sound_reader, 'SESSION_POOL', SimpleNamespace(get=lambda *args, **kwargs: session))
+    return session
+
+
+def test_files_before_a_failing_one_are_stored_and_reported(monkeypatch):
+    audio_by_file = {'a.mp4': burst_audio(10 * SAMPLE_RATE, [(2, 5)]),
+                     'b.mp4': burst_audio(8 * SAMPLE_RATE, [(1, 3)]),
+                     'c.mp4': None}
+    session = fake_detection(monkeypatch, audio_by_file)
+    options = dict(block_size=60, threshold=0.5, focus_idx=0, batch_size=4)
+    reported = []
+    with pytest.raises(Exception, match="c.mp4"):
+        get_timestamps_multi(list(audio_by_file), **options,
+                             on_result=lambda i, result: reported.append((i, result[1])))
+    assert reported == [(0, False), (1, False)]
+
+    runs = len(session.input_shapes)
+    results = get_timestamps_multi(['a.mp4', 'b.mp4'], **options)
+    assert [used_existing for _, used_existing in results] == [True, True]
+    assert len(session.input_shapes) == runs
+
+
+def test_parallel_detection_reports_files_in_order(monkeypatch):
+    audio_by_file = {f'{n}.mp4': burst_audio((n + 1) * SAMPLE_RATE, [(0, 1)]) for n in range(5)}
+    fake_detection(monkeypatch, audio_by_file)
+    reported = []
+    results = get_timestamps_parallel(list(audio_by_file), block_size=60, threshold=0.5, focus_idx=0,
+                                      workers=2, on_result=lambda i, result: reported.append(i))
+    assert reported == list(range(5))
+    assert [info['filename'] for info, _ in results] == list(audio_by_file)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from timestamp_cache import TimestampCache
+
+KEY = ('sampled:abc', 100, 600, 0.9, '/models/model_f16.onnx')
+SCORES_KEY = ('sampled:abc', 600, 58, '/models/model_f16.onnx')
+INFO = {'filename': 'a.mp4', 'timestamps': [{'start': 1.0, 'end': 2.0, 'pred': 0.95}],
+        'block_count': 1, 'version': 2}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TimestampCache(str(tmp_path / 'cache.sqlite'))
+    yield cache
+    cache.close()
+
+
+def test_hit_returns_what_was_stored_without_the_filename(cache):
+    cache.put(KEY, INFO)
+    assert cache.get(KEY) == {k: v for k, v in INFO.items() if k != 'filename'}
+
+
+def test_models_are_matched_by_file_name(cache):
+    cache.put(KEY, INFO)
+    assert cache.get(KEY[:4] + ('model_f16.onnx',)) is not None
+
+
+def test_other_settings_miss(cache):
+    cache.put(KEY, INFO)
+    assert cache.get(('sampled:abc', 50, 600, 0.9, KEY[4])) is None
+    assert cache.get(('sampled:abc', 100, 600, 0.8, KEY[4])) is None
+    assert cache.get(('sampled:def', 100, 600, 0.9, KEY[4])) is None
+
+
+def test_scores_round_trip(cache):
+    block_scores = [np.linspace(0, 1, 5, dtype=np.float32), np.ones(3, dtype=np.float32)]
+    cache.put_scores(SCORES_KEY, block_scores)
+    stored = cache.get_scores(SCORES_KEY)
+    assert len(stored) == 2
+    for expected, actual in zip(block_scores, stored):
+        np.testing.assert_array_equal(expected, actual)
+
+
+def test_invalidate_by_file_hash(cache):
+    cache.put(KEY, INFO)
+    cache.put_scores(SCORES_KEY, [np.ones(3, dtype=np.float32)])
+    other = ('sampled:def',) + KEY[1:]
+    cache.put(other, INFO)
+
+    assert cache.invalidate(file_hash='sampled:abc') == 2
+    assert cache.get(KEY) is None
+    assert cache.get_scores(SCORES_KEY) is None
+    assert cache.get(other) is not None
+
+
+def test_invalidate_by_model(cache):
+    cache.put(KEY, INFO)
+    cache.put(KEY[:4] + ('other.onnx',), INFO)
+    assert cache.invalidate(model='model_f16.onnx') == 1
+    assert cache.get(KEY) is None
+    assert cache.get(KEY[:4] + ('other.onnx',)) is not None
+
+
+def test_clear_removes_everything(cache):
+    cache.put(KEY, INFO)
+    cache.put_scores(SCORES_KEY, [np.ones(3, dtype=np.float32)])
+    cache.clear()
+    assert cache.size_bytes() == 0
+
+
+def test_least_recently_used_entries_are_evicted_first(cache):
+    first, second, third = (('sampled:' + name,) + KEY[1:] for name in 'abc')
+    cache.put(first, INFO)
+    entry_size = cache.size_bytes()
+    cache.max_size = entry_size * 2
+    cache.put(second, INFO)
+    # Reading the first entry makes the second the least recently used
+    cache.get(first)
+    cache.put(third, INFO)
+
+    assert cache.get(first) is not None
+    assert cache.get(second) is None
+    assert cache.get(third) is not None
@@ -0,0 +1,225 @@
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils import get_app_data_dir
+
+DEFAULT_CACHE_FILENAME = "timestamps.sqlite"
+DEFAULT_MAX_CACHE_MB = 256
+
+TimestampKey = Tuple[str, int, int, float, str]
+ScoresKey = Tuple[str, int, int, str]
+
+CACHE_TABLES = ("timestamps", "scores")
+
+
+class TimestampCache:
+    """On-disk timestamp cache shared across runs.
+
+    Timestamps are keyed by (file_hash, precision, block_size, threshold, model).
+    The model's framewise scores for the focus class are stored separately,
+    keyed by (file_hash, block_size, focus_idx, model), so timestamps for a new
+    precision or threshold can be rebuilt without running inference again.
+    Entries from both tables are evicted least-recently-used first once the
+    stored data exceeds max_size_mb. Models are stored by file name so the cache stays valid when
+    the app is moved or run from another machine.
+    """
+
+    def __init__(self, path: str, max_size_mb: int = DEFAULT_MAX_CACHE_MB):
+        self.path = path
+        self.max_size = max_size_mb * 1024 * 1024
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS timestamps (
+                    file_hash TEXT NOT NULL,
+                    precision INTEGER NOT NULL,
+                    block_size INTEGER NOT NULL,
+                    threshold REAL NOT NULL,
+                    model TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (file_hash, precision, block_size, threshold, model)
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS scores (
+                    file_hash TEXT NOT NULL,
+                    block_size INTEGER NOT NULL,
+                    focus_idx INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (file_hash, block_size, focus_idx, model)
+                )""")
+            # File hashes indexed by size and mtime, so unchanged files are never hashed twice
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS fingerprints (
+                    path TEXT NOT NULL,
+                    strategy TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (path, strategy)
+                )""")
+
+    def _key(self, key: TimestampKey) -> tuple:
+        file_hash, precision, block_size, threshold, model = key
+        return (file_hash, precision, block_size, threshold, os.path.basename(model))
+
+    def get(self, key: TimestampKey) -> Optional[Dict[str, Any]]:
+        key = self._key(key)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data FROM timestamps WHERE file_hash = ? AND precision = ? AND block_size = ? AND threshold = ? AND model = ?",
+                key).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE timestamps SET last_access = ? WHERE file_hash = ? AND precision = ? AND block_size = ? AND threshold = ? AND model = ?",
+                (time.time(), *key))
+        return json.loads(row[0])
+
+    def put(self, key: TimestampKey, info: Dict[str, Any]):
+        data = json.dumps(
+            {k: v for k, v in info.items() if k != 'filename'}).encode('utf-8')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO timestamps VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*self._key(key), data, len(data), time.time()))
+            self._evict()
+
+    def get_scores(self, key: ScoresKey) -> Optional[List[np.ndarray]]:
+        file_hash, block_size, focus_idx, model = key
+        key = (file_hash, block_size, focus_idx, os.path.basename(model))
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data FROM scores WHERE file_hash = ? AND block_size = ? AND focus_idx = ? AND model = ?",
+                key).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE scores SET last_access = ? WHERE file_hash = ? AND block_size = ? AND focus_idx = ? AND model = ?",
+                (time.time(), *key))
+
+        with np.load(io.BytesIO(row[0])) as stored:
+            scores, lengths = stored['scores'], stored['lengths']
+        return np.split(scores, np.cumsum(lengths)[:-1])
+
+    def put_scores(self, key: ScoresKey, block_scores: List[np.ndarray]):
+        # Blocks are stored as one flat array plus their lengths
+        file_hash, block_size, focus_idx, model = key
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            scores=np.concatenate(block_scores).astype(np.float32) if block_scores else np.zeros(0, dtype=np.float32),
+            lengths=np.array([len(x) for x in block_scores], dtype=np.int64))
+        data = buffer.getvalue()
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, block_size, focus_idx, os.path.basename(model), data, len(data), time.time()))
+            self._evict()
+
+    def get_fingerprint(self, path: str, strategy: str) -> Optional[Tuple[int, int, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT size, mtime_ns, digest FROM fingerprints WHERE path = ? AND strategy = ?",
+                (path, strategy)).fetchone()
+
+    def put_fingerprint(self, path: str, strategy: str, size: int, mtime_ns: int, digest: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)",
+                (path, strategy, size, mtime_ns, digest))
+
+    def _total_size(self) -> int:
+        return sum(
+            self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+            for table in CACHE_TABLES)
+
+    def _evict(self):
+        total = self._total_size()
+        if total <= self.max_size:
+            return
+
+        rows = self._conn.execute(
+            "SELECT 'timestamps', rowid, size, last_access FROM timestamps "
+            "UNION ALL SELECT 'scores', rowid, size, last_access FROM scores "
+            "ORDER BY last_access ASC").fetchall()
+        for table, rowid, size, _ in rows:
+            if total <= self.max_size:
+                break
+            self._conn.execute(
+                f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+            total -= size
+
+    def invalidate(self, file_hash: Optional[str] = None, model: Optional[str] = None) -> int:
+        # Removes every entry matching the given file hash and/or model (all entries if neither is given)
+        conditions = []
+        params = []
+        if file_hash is not None:
+            conditions.append("file_hash = ?")
+            params.append(file_hash)
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(os.path.basename(model))
+
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        with self._lock, self._conn:
+            return sum(
+                self._conn.execute(f"DELETE FROM {table}{where}", params).rowcount
+                for table in CACHE_TABLES)
+
+    def clear(self):
+        self.invalidate()
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._total_size()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[TimestampCache] = None
+_cache_settings = {'path': None, 'max_size_mb': DEFAULT_MAX_CACHE_MB, 'enabled': True}
+_cache_lock = threading.Lock()
+
+
+def configure_cache(path: Optional[str] = None, max_size_mb: int = DEFAULT_MAX_CACHE_MB, enabled: bool = True):
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+        _cache_settings.update(
+            {'path': path, 'max_size_mb': max_size_mb, 'enabled': enabled})
+
+
+def get_cache() -> Optional[TimestampCache]:
+    global _cache
+    with _cache_lock:
+        if _cache is None and _cache_settings['enabled']:
+            path = _cache_settings['path'] or os.path.join(
+                get_app_data_dir(), DEFAULT_CACHE_FILENAME)
+            try:
+                _cache = TimestampCache(path, _cache_settings['max_size_mb'])
+            except (sqlite3.Error, OSError) as e:
+                print(f"Could not open timestamp cache at {path}: {e}")
+                _cache_settings['enabled'] = False
+        return _cache
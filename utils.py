@@ -3,10 +3,13 @@ import os
 import platform
 import shutil
 import re
+import subprocess
+import threading
 from pathlib import Path
 
 from typing import Literal, Tuple, Dict, Any, Optional, List
 
+from proglog import ProgressBarLogger, default_bar_logger
 from yt_dlp import YoutubeDL
 from yt_dlp.utils import DownloadError
 from yt_dlp.networking.exceptions import TransportError
@@ -35,6 +38,147 @@ else:  # Linux
 FFMPEG_PATH = get_bundle_filepath(ffmpeg_path)
 
 
+def get_app_data_dir() -> str:
+    # Writable per-user location for caches and machine-specific settings
+    data_dir = os.environ.get('AUTOCOMPER_HOME') or os.path.join(
+        Path.home(), '.autocomper')
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def machine_id() -> str:
+    # The app data dir can roam between computers, so benchmark results are kept per machine
+    return f"{platform.node()}/{platform.machine()}/{platform.processor() or 'cpu'}/{os.cpu_count()}"
+
+
+class LockedBarLogger(ProgressBarLogger):
+    # Serializes updates from several worker threads into one shared logger
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = default_bar_logger(logger)
+        self.lock = threading.Lock()
+
+    def __call__(self, **kw):
+        with self.lock:
+            super().__call__(**kw)
+            self.logger(**kw)
+
+
+class MergedBarLogger(ProgressBarLogger):
+    # Reports the bars of several parallel jobs as a single bar, whose index
+    # is the sum of theirs. The total is known upfront; call finish() when done.
+    def __init__(self, logger, total_seconds, bar='t'):
+        super().__init__()
+        self.logger = default_bar_logger(logger)
+        self.lock = threading.Lock()
+        self.bar = bar
+        self.total = max(1, int(round(total_seconds * 100)))
+        self.indices = {}
+
+        self.logger(**{f"{bar}__total": self.total})
+        self.logger(**{f"{bar}__index": 0})
+
+    def __call__(self, **kw):
+        with self.lock:
+            for key, value in kw.items():
+                name, _, attr = key.rpartition('__')
+                if attr == 'index':
+                    self.indices[name] = value
+            self.logger(**{f"{self.bar}__index": min(self.total - 1, sum(self.indices.values()))})
+
+    def finish(self):
+        self.logger(**{f"{self.bar}__index": self.total})
+
+
+def probe_media(file: str) -> Dict[str, Any]:
+    # No ffprobe is bundled, so read the stream summary ffmpeg prints for an input-only command
+    cmd = [FFMPEG_PATH, '-hide_banner', '-i', file]
+
+    subprocess_options = {
+        'stdout': subprocess.PIPE,
+        'stderr': subprocess.PIPE,
+    }
+
+    if sys.platform.startswith('win'):
+        subprocess_options['creationflags'] = subprocess.CREATE_NO_WINDOW
+
+    result = subprocess.run(cmd, **subprocess_options)
+    output = result.stderr.decode('utf-8', errors='replace')
+
+    info = {'duration': None, 'video': None, 'audio': None}
+
+    duration = re.search(r'Duration: (\d+):(\d+):([\d.]+)', output)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    video = re.search(r'Stream #\d+:\d+.*?: Video: (\w+)[^,\n]*, (\w+)(.*)', output)
+    if video:
+        codec, pix_fmt, rest = video.groups()
+        size = re.search(r'(\d{2,5})x(\d{2,5})', rest)
+        fps = re.search(r'([\d.]+) fps', rest)
+        tbn = re.search(r'([\d.]+k?) tbn', rest)
+        info['video'] = {
+            'codec': codec,
+            'pix_fmt': pix_fmt,
+            'width': int(size.group(1)) if size else None,
+            'height': int(size.group(2)) if size else None,
+            'fps': float(fps.group(1)) if fps else None,
+            'tbn': tbn.group(1) if tbn else None,
+        }
+
+    audio = re.search(r'Stream #\d+:\d+.*?: Audio: (\w+)[^,\n]*, (\d+) Hz, ([^,\n]+)', output)
+    if audio:
+        codec, sample_rate, channels = audio.groups()
+        info['audio'] = {
+            'codec': codec,
+            'sample_rate': int(sample_rate),
+            'channels': channels.strip(),
+        }
+
+    return info
+
+
+def list_models(models_dir: str) -> List[str]:
+    # ONNX model files available in models_dir, by file name
+    return [item for item in os.listdir(models_dir)
+            if os.path.isfile(os.path.join(models_dir, item)) and item.endswith('.onnx')]
+
+
+def convert_seconds_to_timestamp(seconds: float) -> str:
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    remaining_seconds = int(
+        round((seconds % 3600) % 60))
+
+    if remaining_seconds == 60:
+        minutes += 1
+        remaining_seconds = 0
+
+    if minutes == 60:
+        hours += 1
+        minutes = 0
+
+    timestamp = f"{hours}:{minutes:02}:{remaining_seconds:02}"
+    return timestamp
+
+
+def format_timestamps_text(dict_list: List[Dict[str, Any]]) -> Optional[str]:
+    # Human-readable listing of every clip found, or None if there are none
+    timestamps_text = ""
+    found_timestamps = False
+    for file in dict_list:
+        timestamps_text += f"{file['filename']}\n"
+
+        for ts in file['timestamps']:
+            timestamps_text += f"{convert_seconds_to_timestamp(ts['start'])} - {convert_seconds_to_timestamp(ts['end'])}, confidence: {ts['pred']}\n"
+            found_timestamps = True
+
+        timestamps_text += "\n"
+
+    return timestamps_text if found_timestamps else None
+
+
 def convert_quality_str_to_int(quality: str) -> int:
     if not quality:
         return None
@@ -165,6 +309,7 @@ def download_video(url: str, filename: str, output_location: str, max_quality: s
         'outtmpl': f"{filename}.%(ext)s",
         'format': format_str,
         'quiet': True,
+        'noprogress': True,
         'logger': logger,
         'progress_hooks': [logger.hook],
         'ffmpeg_location': FFMPEG_PATH
@@ -173,49 +318,42 @@ def download_video(url: str, filename: str, output_location: str, max_quality: s
     if max_speed > 0:
         ydl_opts['limit_rate'] = f"{max_speed}K"
 
-    with open(os.devnull, 'w') as devnull:
-        attempts = 0
-        while attempts < n_retries:
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = devnull
-            sys.stderr = devnull
-
-            try:
-                with YoutubeDL(ydl_opts) as ydl:
-                    # Check if there is any valid video
-                    # There are cases where we need to skip instead of stopping, e.x. TikTok photo slideshows
-                    video_info = ydl.extract_info(url, download=False)
-
-                    has_video = any(
-                        (fmt.get('vcodec') != 'none' and fmt.get(
-                            'acodec') != 'none')
-                        or
-                        (fmt.get('video_ext') != 'none' and fmt.get(
-                            'audio_ext') != 'none')
-                        for fmt in video_info.get('formats', [])
-                    ) or (
-                        video_info.get('vcodec') and video_info.get(
-                            'vcodec') != 'none'
-                    )
-
-                    if not has_video:
-                        return True, None
-
-                    info_dict = ydl.extract_info(url, download=True)
-
-                file_ext = info_dict.get('ext', 'mp4')
-                output_file = os.path.join(
-                    output_location, f"{filename}.{file_ext}")
-                shutil.move(f"{filename}.{file_ext}", output_file)
-                return True, output_file
-            except Exception as e:
-                attempts += 1
-                if attempts >= n_retries:
-                    return False, str(e)
-            finally:
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
+    # yt-dlp's output all goes to the logger. sys.stdout isn't swapped for
+    # devnull here, since that races with other threads downloading or printing
+    attempts = 0
+    while attempts < n_retries:
+        try:
+            with YoutubeDL(ydl_opts) as ydl:
+                # Check if there is any valid video
+                # There are cases where we need to skip instead of stopping, e.x. TikTok photo slideshows
+                video_info = ydl.extract_info(url, download=False)
+
+                has_video = any(
+                    (fmt.get('vcodec') != 'none' and fmt.get(
+                        'acodec') != 'none')
+                    or
+                    (fmt.get('video_ext') != 'none' and fmt.get(
+                        'audio_ext') != 'none')
+                    for fmt in video_info.get('formats', [])
+                ) or (
+                    video_info.get('vcodec') and video_info.get(
+                        'vcodec') != 'none'
+                )
+
+                if not has_video:
+                    return True, None
+
+                info_dict = ydl.extract_info(url, download=True)
+
+            file_ext = info_dict.get('ext', 'mp4')
+            output_file = os.path.join(
+                output_location, f"{filename}.{file_ext}")
+            shutil.move(f"{filename}.{file_ext}", output_file)
+            return True, output_file
+        except Exception as e:
+            attempts += 1
+            if attempts >= n_retries:
+                return False, str(e)
 
 
 def download_audio(url: str, filename: str, output_location: str, max_speed: int, logger, n_retries: int = 10) -> Tuple[bool, str]:
@@ -232,6 +370,8 @@ def download_audio(url: str, filename: str, output_location: str, max_speed: int
             'preferredcodec': 'mp3',
             'preferredquality': '192',
         }],
+        'noprogress': True,
+        'logger': logger,
         'progress_hooks': [logger.hook],
         'ffmpeg_location': FFMPEG_PATH
     }
@@ -239,30 +379,21 @@ def download_audio(url: str, filename: str, output_location: str, max_speed: int
     if max_speed > 0:
         ydl_opts['limit_rate'] = f"{max_speed}K"
 
-    with open(os.devnull, 'w') as devnull:
-        attempts = 0
-        while attempts < n_retries:
-            old_stdout = sys.stdout
-            old_stderr = sys.stderr
-            sys.stdout = devnull
-            sys.stderr = devnull
-
-            try:
-                with YoutubeDL(ydl_opts) as ydl:
-                    info_dict = ydl.extract_info(url, download=True)
-                    file_ext = ydl.params['postprocessors'][0].get(
-                        'preferredcodec', info_dict.get('ext', 'mp3'))
-                    output_file = os.path.join(
-                        output_location, f"{filename}.{file_ext}")
-                    shutil.move(f"{filename}.{file_ext}", output_file)
-                    return True, output_file
-            except Exception as e:
-                attempts += 1
-                if attempts >= n_retries:
-                    return False, str(e).encode("utf-8")
-            finally:
-                sys.stdout = old_stdout
-                sys.stderr = old_stderr
+    attempts = 0
+    while attempts < n_retries:
+        try:
+            with YoutubeDL(ydl_opts) as ydl:
+                info_dict = ydl.extract_info(url, download=True)
+                file_ext = ydl.params['postprocessors'][0].get(
+                    'preferredcodec', info_dict.get('ext', 'mp3'))
+                output_file = os.path.join(
+                    output_location, f"{filename}.{file_ext}")
+                shutil.move(f"{filename}.{file_ext}", output_file)
+                return True, output_file
+        except Exception as e:
+            attempts += 1
+            if attempts >= n_retries:
+                return False, str(e).encode("utf-8")
 
 
 class MediaUpload: